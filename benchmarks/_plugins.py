@@ -0,0 +1,22 @@
+"""
+Rende importabili i moduli di plugins_custom come nel server, dove vengono copiati
+in plugins_func/functions e si importano tra loro come plugins_func.functions.*
+"""
+
+import os
+import sys
+import types
+
+PLUGINS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "plugins_custom"))
+
+
+def install():
+    if "plugins_func.functions" in sys.modules:
+        return
+    package = sys.modules.setdefault("plugins_func", types.ModuleType("plugins_func"))
+    if not hasattr(package, "__path__"):
+        package.__path__ = []
+    functions = types.ModuleType("plugins_func.functions")
+    functions.__path__ = [PLUGINS_DIR]
+    sys.modules["plugins_func.functions"] = functions
+    package.functions = functions
@@ -0,0 +1,165 @@
+"""
+Benchmark di plugins_custom/page_extractor.py sul corpus di pagine
+
+    python benchmarks/extractor_bench.py                 # pagine/secondo e qualità
+    python benchmarks/extractor_bench.py record URL...   # aggiunge pagine al corpus
+
+Ogni pagina corpus/html/<nome>.html ha accanto <nome>.txt con il testo principale
+controllato a mano (titolo, paragrafi, voci degli elenchi); per ogni estrattore,
+compresi quelli storici di leggi_pagina, si calcola l'F1 sulle parole rispetto a
+quel testo. Le pagine senza .txt non entrano nel benchmark.
+Le pagine fornite sono sintetiche e gli estrattori sono stati messi a punto su di
+esse: l'F1 è un controllo di regressione, non la qualità su pagine reali (README.md)
+"""
+
+import os
+import re
+import sys
+import time
+import hashlib
+from collections import Counter
+
+import _plugins
+
+_plugins.install()
+
+from plugins_func.functions import page_extractor  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CORPUS_DIR = os.path.join(HERE, "corpus", "html")
+MAX_CHARS = 10000  # Come leggi_pagina.PAGE_TEXT_CHARS
+ROUNDS = 5
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+def legacy_clean_html(html: str) -> str:
+    """Ripiego regex di leggi_pagina prima di page_extractor"""
+    for tag in ("script", "style", "nav", "footer", "header"):
+        html = re.sub(rf'<{tag}[^>]*>.*?</{tag}>', '', html, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<[^>]+>', ' ', html)
+    text = re.sub(r'\s+', ' ', text)
+    for entity, char in (('&nbsp;', ' '), ('&amp;', '&'), ('&lt;', '<'), ('&gt;', '>'), ('&quot;', '"')):
+        text = text.replace(entity, char)
+    return text.strip()
+
+
+def legacy_bs4(html: str) -> str:
+    """Estrazione BeautifulSoup di leggi_pagina prima di page_extractor"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe']):
+        tag.decompose()
+    main_content = soup.find('main') or soup.find('article') or soup.find(
+        'div', {'class': re.compile(r'content|article|post|entry')})
+    node = main_content or soup
+    return node.get_text(separator=' ', strip=True)
+
+
+def _limited(func):
+    return lambda html: func(html)[:MAX_CHARS]
+
+
+def extractors() -> dict:
+    found = {
+        "legacy_regex": _limited(legacy_clean_html),
+        "stdlib": lambda html: page_extractor.extract_text(html, MAX_CHARS, page_extractor.StreamingTextExtractor)[:MAX_CHARS],
+    }
+    try:
+        import bs4  # noqa: F401
+        found["legacy_bs4"] = _limited(legacy_bs4)
+    except ImportError:
+        pass
+    if page_extractor.LexborParser is not None:
+        found["lexbor"] = lambda html: page_extractor.extract_text(html, MAX_CHARS, page_extractor.LexborTextExtractor)[:MAX_CHARS]
+    return found
+
+
+def _words(text: str) -> Counter:
+    return Counter(re.findall(r'\w+', text.lower()))
+
+
+def f1(candidate: str, reference: str) -> float:
+    cand, ref = _words(candidate), _words(reference)
+    common = sum((cand & ref).values())
+    if not common:
+        return 0.0
+    precision = common / sum(cand.values())
+    recall = common / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def page_name(url: str) -> str:
+    slug = re.sub(r'[^\w]+', '_', url.split("://", 1)[-1]).strip('_')[:60]
+    return f"{slug}_{hashlib.sha1(url.encode()).hexdigest()[:8]}"
+
+
+def record(urls: list):
+    import requests
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    for url in urls:
+        try:
+            response = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=20)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"SKIP {url}: {e}")
+            continue
+        path = os.path.join(CORPUS_DIR, page_name(url) + ".html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(response.text)
+        print(f"OK   {url} -> {os.path.basename(path)} ({len(response.content) // 1024} KB): "
+              f"scrivere a mano {os.path.basename(path)[:-5]}.txt")
+
+
+def load_corpus() -> list:
+    """(nome, html, testo di riferimento) delle pagine con il .txt controllato a mano"""
+    pages = []
+    if not os.path.isdir(CORPUS_DIR):
+        return pages
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if not name.endswith(".html"):
+            continue
+        gold_path = os.path.join(CORPUS_DIR, name[:-len(".html")] + ".txt")
+        if not os.path.exists(gold_path):
+            print(f"{name}: manca il testo di riferimento, pagina esclusa")
+            continue
+        with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+            html = f.read()
+        with open(gold_path, encoding="utf-8") as f:
+            gold = f.read()
+        pages.append((name[:-len(".html")], html, gold))
+    return pages
+
+
+def run():
+    pages = load_corpus()
+    if not pages:
+        print("Corpus vuoto: nessuna pagina con testo di riferimento in corpus/html")
+        return
+    total_mb = sum(len(html) for _name, html, _gold in pages) / 1024 / 1024
+    print(f"{len(pages)} pagine, {total_mb:.1f} MB, {ROUNDS} giri")
+    print("F1 su pagine sintetiche: controllo di regressione, non qualità su pagine reali\n")
+
+    found = extractors()
+    scores = {}
+    print(f"{'estrattore':<14}{'pagine/s':>10}{'ms/pagina':>11}{'F1':>7}")
+    for name, extract in found.items():
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            outputs = [extract(html) for _name, html, _gold in pages]
+        elapsed = time.perf_counter() - started
+        runs = ROUNDS * len(pages)
+        scores[name] = [f1(out, gold) for out, (_name, _html, gold) in zip(outputs, pages)]
+        quality = sum(scores[name]) / len(pages)
+        print(f"{name:<14}{runs / elapsed:>10.1f}{elapsed / runs * 1000:>11.2f}{quality:>7.2f}")
+
+    print(f"\n{'F1 per pagina':<26}" + "".join(f"{name:>14}" for name in found))
+    for i, (page, _html, _gold) in enumerate(pages):
+        print(f"{page[:25]:<26}" + "".join(f"{scores[name][i]:>14.2f}" for name in found))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["record"]:
+        record(sys.argv[2:])
+    else:
+        run()
@@ -0,0 +1,130 @@
+"""
+Async Plugins - Esecuzione dei plugin senza bloccare la loop asyncio del server
+register_async_function registra handler `async def`, che vengono attesi sulla loop
+della connessione. register_blocking_function registra handler sincroni con I/O
+bloccante (timeout di 10-15 s), eseguiti in un pool di thread limitato, così un
+servizio lento non ferma le altre connessioni. Tutti gli altri plugin, compresi
+quelli del server che toccano conn o la loop, restano eseguiti come prima, sulla loop.
+
+Lo spostamento nel pool non è automatico: un plugin sincrono che fa I/O va registrato
+con register_blocking_function. In plugins_custom restano sulla loop solo le
+barzellette (liste in memoria, nessun I/O); ricette usa il pool, tutti gli altri sono
+async. I plugin del server non vengono toccati.
+
+L'aggancio avviene sull'esecutore dei plugin del server ed è obbligatorio: se non si
+può installare l'import del modulo fallisce, così il problema emerge all'avvio e non
+alla prima chiamata di un plugin async
+"""
+
+import json
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config.logger import setup_logging
+from plugins_func.register import register_function, ActionResponse, Action
+
+TAG = __name__
+logger = setup_logging()
+
+# Thread per i plugin bloccanti: oltre questo numero le chiamate attendono in coda
+SYNC_PLUGIN_WORKERS = 8
+
+# nome funzione -> handler async def
+async_handlers = {}
+# nome funzione -> handler sincrono da eseguire nel pool (solo quelli registrati qui)
+blocking_handlers = {}
+
+_sync_pool = ThreadPoolExecutor(max_workers=SYNC_PLUGIN_WORKERS, thread_name_prefix="plugin")
+
+
+def _sync_adapter(name: str, handler):
+    """Segnaposto registrato nel server: le chiamate vere passano dall'esecutore agganciato"""
+
+    @functools.wraps(handler)
+    def adapter(conn, **kwargs):
+        # Si arriva qui solo se qualcuno chiama la funzione registrata scavalcando l'esecutore
+        logger.bind(tag=TAG).error(f"{name}: plugin async chiamato fuori dall'esecutore dei plugin")
+        return ActionResponse(Action.ERROR, f"{name} è un plugin async e va eseguito dall'esecutore", None)
+
+    adapter._async_handler = handler
+    return adapter
+
+
+def register_async_function(name: str, desc: dict, type=None):
+    """Come register_function, per handler async def(conn, **argomenti)"""
+
+    def decorator(handler):
+        async_handlers[name] = handler
+        register_function(name, desc, type)(_sync_adapter(name, handler))
+        return handler
+
+    return decorator
+
+
+def register_blocking_function(name: str, desc: dict, type=None):
+    """Come register_function, per handler sincroni con I/O bloccante: girano nel pool di thread"""
+
+    def decorator(handler):
+        blocking_handlers[name] = handler
+        return register_function(name, desc, type)(handler)
+
+    return decorator
+
+
+def _parse_arguments(arguments) -> dict:
+    if isinstance(arguments, str):
+        return json.loads(arguments) if arguments.strip() else {}
+    return dict(arguments or {})
+
+
+async def _run_async_handler(name: str, handler, conn, arguments) -> ActionResponse:
+    try:
+        result = await handler(conn, **_parse_arguments(arguments))
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"Errore plugin {name}: {e}")
+        return ActionResponse(Action.ERROR, str(e), None)
+    return result
+
+
+async def _run_blocking_handler(name: str, handler, conn, arguments) -> ActionResponse:
+    loop = asyncio.get_running_loop()
+    try:
+        kwargs = _parse_arguments(arguments)
+        return await loop.run_in_executor(_sync_pool, functools.partial(handler, conn, **kwargs))
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"Errore plugin {name}: {e}")
+        return ActionResponse(Action.ERROR, str(e), None)
+
+
+def install_executor_hook():
+    """Aggancia l'esecutore dei plugin del server (una sola volta); RuntimeError se non si può"""
+    try:
+        from core.providers.tools.server_plugins.plugin_executor import ServerPluginExecutor
+    except ImportError as e:
+        logger.bind(tag=TAG).error(f"Esecutore plugin del server non trovato: {e}")
+        raise RuntimeError("Impossibile agganciare l'esecutore dei plugin: i plugin async non possono girare") from e
+
+    original = getattr(ServerPluginExecutor, "execute", None)
+    if original is None or not asyncio.iscoroutinefunction(original):
+        logger.bind(tag=TAG).error("ServerPluginExecutor.execute mancante o non async")
+        raise RuntimeError("Esecutore plugin del server incompatibile: i plugin async non possono girare")
+    if getattr(original, "_async_hook", False):
+        return
+
+    @functools.wraps(original)
+    async def execute(self, conn, tool_name, arguments, *args, **kwargs):
+        handler = async_handlers.get(tool_name)
+        if handler is not None:
+            return await _run_async_handler(tool_name, handler, conn, arguments)
+        handler = blocking_handlers.get(tool_name)
+        if handler is not None:
+            return await _run_blocking_handler(tool_name, handler, conn, arguments)
+        # Tutti gli altri (plugin del server compresi) come prima, sulla loop
+        return await original(self, conn, tool_name, arguments, *args, **kwargs)
+
+    execute._async_hook = True
+    ServerPluginExecutor.execute = execute
+    logger.bind(tag=TAG).info(f"Esecutore plugin agganciato: handler async, bloccanti su {SYNC_PLUGIN_WORKERS} thread")
+
+
+install_executor_hook()
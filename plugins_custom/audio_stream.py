@@ -0,0 +1,180 @@
+"""
+Audio Stream - Helper condivisi per lo streaming audio verso il dispositivo
+Legge PCM da ffmpeg, lo codifica in pacchetti Opus e lo invia alla coda audio
+senza passare da file temporanei
+"""
+
+import asyncio
+import opuslib_next
+from config.logger import setup_logging
+from core.providers.tts.dto.dto import TTSMessageDTO, SentenceType, ContentType
+from plugins_func.functions.media_supervisor import supervisor
+
+TAG = __name__
+logger = setup_logging()
+
+# Formato audio del dispositivo (stesso usato dal server per il TTS)
+SAMPLE_RATE = 16000
+CHANNELS = 1
+FRAME_DURATION_MS = 60
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_DURATION_MS // 1000
+FRAME_BYTES = FRAME_SAMPLES * 2 * CHANNELS  # PCM 16 bit
+
+# Pacchetti Opus inviati alla coda audio per ogni lettura (~300ms)
+PACKETS_PER_PUSH = 5
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+def ffmpeg_input_args(url: str, headers: dict = None) -> list:
+    """Argomenti di input ffmpeg per una sorgente HTTP con riconnessione automatica"""
+    args = [
+        "-reconnect", "1",
+        "-reconnect_streamed", "1",
+        "-reconnect_delay_max", "5",
+    ]
+    headers = dict(headers or {})
+    args += ["-user_agent", headers.pop("User-Agent", USER_AGENT)]
+    if headers:
+        args += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    return args + ["-i", url]
+
+
+def ffmpeg_pcm_output_args() -> list:
+    """Argomenti di output ffmpeg: PCM 16kHz mono su stdout"""
+    return [
+        "-vn",
+        "-ac", str(CHANNELS),
+        "-ar", str(SAMPLE_RATE),
+        "-f", "s16le",
+        "pipe:1",
+    ]
+
+
+def ffmpeg_pcm_cmd(url: str) -> list:
+    """Comando ffmpeg che decodifica una sorgente in PCM 16kHz mono su stdout"""
+    return ["ffmpeg", "-loglevel", "error", *ffmpeg_input_args(url), *ffmpeg_pcm_output_args()]
+
+
+async def open_pcm_process(url: str, kind: str = "stream") -> asyncio.subprocess.Process:
+    """Avvia ffmpeg in streaming verso stdout tramite il supervisore media"""
+    return await supervisor.spawn(
+        kind,
+        ffmpeg_pcm_cmd(url),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+
+async def kill_process(process: asyncio.subprocess.Process):
+    """Termina un processo ffmpeg se ancora attivo e ne svuota stdout"""
+    if process is None:
+        return
+    try:
+        if process.returncode is None:
+            process.kill()
+    except ProcessLookupError:
+        pass
+    try:
+        # wait() (anche quello del supervisore) torna solo quando stdout arriva a EOF:
+        # se nessuno lo legge più e il buffer è pieno resterebbe bloccato per sempre
+        await process.communicate()
+    except Exception as e:
+        logger.bind(tag=TAG).warning(f"Errore terminazione processo: {e}")
+
+
+class OpusFrameEncoder:
+    """Accumula PCM e restituisce pacchetti Opus da FRAME_DURATION_MS"""
+
+    def __init__(self):
+        self._encoder = opuslib_next.Encoder(SAMPLE_RATE, CHANNELS, opuslib_next.APPLICATION_AUDIO)
+        self._pending = bytearray()
+
+    def encode(self, pcm: bytes) -> list:
+        self._pending.extend(pcm)
+        packets = []
+        while len(self._pending) >= FRAME_BYTES:
+            frame = bytes(self._pending[:FRAME_BYTES])
+            del self._pending[:FRAME_BYTES]
+            packets.append(self._encoder.encode(frame, FRAME_SAMPLES))
+        return packets
+
+    def flush(self) -> list:
+        """Codifica l'ultimo frame parziale completandolo con silenzio"""
+        if not self._pending:
+            return []
+        frame = bytes(self._pending) + b"\x00" * (FRAME_BYTES - len(self._pending))
+        self._pending.clear()
+        return [self._encoder.encode(frame, FRAME_SAMPLES)]
+
+
+def start_playback(conn):
+    """Apre il turno audio sul dispositivo"""
+    if conn.intent_type == "intent_llm":
+        conn.tts.tts_text_queue.put(
+            TTSMessageDTO(
+                sentence_id=conn.sentence_id,
+                sentence_type=SentenceType.FIRST,
+                content_type=ContentType.ACTION,
+            )
+        )
+
+
+def end_playback(conn):
+    """Chiude il turno audio sul dispositivo"""
+    if conn.intent_type == "intent_llm":
+        conn.tts.tts_text_queue.put(
+            TTSMessageDTO(
+                sentence_id=conn.sentence_id,
+                sentence_type=SentenceType.LAST,
+                content_type=ContentType.ACTION,
+            )
+        )
+
+
+def push_opus_packets(conn, packets: list):
+    """Mette i pacchetti Opus direttamente nella coda audio del TTS"""
+    if packets:
+        conn.tts.tts_audio_queue.put((SentenceType.MIDDLE, packets, None))
+
+
+def is_connection_closed(conn) -> bool:
+    stop_event = getattr(conn, "stop_event", None)
+    return stop_event is not None and stop_event.is_set()
+
+
+async def stream_process_to_conn(conn, process: asyncio.subprocess.Process, stop_event: asyncio.Event = None,
+                                 initial: bytes = b"", sink=None) -> int:
+    """
+    Legge PCM da stdout di ffmpeg e lo invia al dispositivo finché il processo
+    termina, viene chiesto lo stop o la connessione si chiude.
+    `initial` sono eventuali byte PCM già letti dal chiamante; `sink`, se dato,
+    riceve anche gli stessi pacchetti Opus (es. per scriverli in cache).
+    Restituisce il numero di pacchetti inviati.
+    """
+    encoder = OpusFrameEncoder()
+    sent = 0
+    read_size = FRAME_BYTES * PACKETS_PER_PUSH
+    stop_event = stop_event or asyncio.Event()
+
+    def deliver(packets):
+        nonlocal sent
+        push_opus_packets(conn, packets)
+        if sink is not None and packets:
+            sink(packets)
+        sent += len(packets)
+
+    if initial:
+        deliver(encoder.encode(initial))
+
+    while not stop_event.is_set() and not is_connection_closed(conn):
+        pcm = await process.stdout.read(read_size)
+        if not pcm:
+            break
+        deliver(encoder.encode(pcm))
+
+    if not stop_event.is_set():
+        deliver(encoder.flush())
+
+    return sent
@@ -1,17 +1,35 @@
 """
 Cerca Musica Plugin - Cerca su YouTube, scarica e riproduce musica
+In modalità progressiva la riproduzione parte appena arrivano i primi frame,
+mentre gli stessi pacchetti Opus vengono scritti in cache (.opf) per le
+riproduzioni successive, che non richiedono più alcuna decodifica
 """
 
 import os
-import re
-import hashlib
 import asyncio
-from pathlib import Path
+import threading
 from config.logger import setup_logging
-from plugins_func.register import register_function, ToolType, ActionResponse, Action
+from plugins_func.register import ToolType, ActionResponse, Action
+from plugins_func.functions.async_plugins import register_async_function
 from core.handle.sendAudioHandle import send_stt_message
 from core.utils.dialogue import Message
 from core.providers.tts.dto.dto import TTSMessageDTO, SentenceType, ContentType
+from plugins_func.functions.media_tasks import (
+    track_task, track_process, untrack_process, track_cancel_event, untrack_cancel_event, cancel_media,
+    on_disconnect,
+)
+from plugins_func.functions.audio_stream import (
+    ffmpeg_input_args, ffmpeg_pcm_output_args, kill_process, stream_process_to_conn,
+    start_playback, end_playback, FRAME_BYTES
+)
+from plugins_func.functions.media_supervisor import supervisor, SupervisorBusy
+from plugins_func.functions.music_cache import MusicCacheIndex
+from plugins_func.functions.music_library import LocalMusicLibrary
+from plugins_func.functions.music_prefetch import PrefetchBudget
+from plugins_func.functions.single_flight import SingleFlight, FlightAbandoned
+from plugins_func.functions.opus_cache import (
+    OpusFrameWriter, is_opus_cache_file, play_opus_file, transcode_to_opus_file
+)
 
 TAG = __name__
 logger = setup_logging()
@@ -20,6 +38,31 @@ logger = setup_logging()
 MUSIC_CACHE_DIR = "/tmp/xiaozhi_music_cache"
 MAX_CACHE_SIZE_MB = 100
 
+# Indice persistente: query normalizzata -> video id -> file (LRU)
+music_cache = MusicCacheIndex(MUSIC_CACHE_DIR, MAX_CACHE_SIZE_MB * 1024 * 1024)
+
+# Cartella musicale locale o NAS, cercata prima di YouTube (vuota = disabilitata)
+LOCAL_MUSIC_DIR = os.environ.get("XIAOZHI_MUSIC_DIR", "")
+
+music_library = LocalMusicLibrary(LOCAL_MUSIC_DIR)
+music_library.start()
+
+# Un solo download per video anche se più dispositivi lo chiedono insieme
+downloads = SingleFlight("music_download")
+
+# Riproduzione progressiva durante il download (False = scarica tutto e poi riproduci)
+MUSIC_PROGRESSIVE = True
+FIRST_AUDIO_TIMEOUT = 30  # Secondi massimi di attesa per i primi frame
+
+# Download anticipato dei prossimi brani probabili (stesso artista) durante l'ascolto
+MUSIC_PREFETCH = True
+PREFETCH_TRACKS = 2  # Brani anticipati per richiesta
+PREFETCH_MB_PER_HOUR = 30  # Banda massima per dispositivo
+PREFETCH_PENDING_MB = 20  # Cache massima per dispositivo occupata da brani non ancora ascoltati
+
+prefetch_budget = PrefetchBudget(PREFETCH_MB_PER_HOUR * 1024 * 1024, PREFETCH_PENDING_MB * 1024 * 1024)
+_prefetch_tasks = set()
+
 CERCA_MUSICA_FUNCTION_DESC = {
     "type": "function",
     "function": {
@@ -44,92 +87,124 @@ CERCA_MUSICA_FUNCTION_DESC = {
 }
 
 
-def get_cache_path(query: str) -> str:
-    """Genera path cache basato sulla query"""
-    os.makedirs(MUSIC_CACHE_DIR, exist_ok=True)
-    # Hash della query per filename sicuro
-    query_hash = hashlib.md5(query.lower().encode()).hexdigest()[:12]
-    safe_name = re.sub(r'[^\w\s-]', '', query)[:30].strip().replace(' ', '_')
-    return os.path.join(MUSIC_CACHE_DIR, f"{safe_name}_{query_hash}.mp3")
-
+def download_from_youtube(video_url: str, output_base: str, cancel_event: threading.Event = None) -> str:
+    """
+    Scarica l'audio originale di un video YouTube con yt-dlp, senza transcodifica
+    (interrompibile tramite cancel_event). Restituisce il percorso del file scaricato
+    """
+    try:
+        import yt_dlp
 
-def check_cache(query: str) -> str:
-    """Controlla se la canzone è in cache"""
-    cache_path = get_cache_path(query)
-    if os.path.exists(cache_path):
-        logger.bind(tag=TAG).info(f"Cache hit: {cache_path}")
-        return cache_path
-    return None
+        def check_cancel(_progress):
+            # Sollevare un'eccezione da un progress hook interrompe il download
+            if cancel_event is not None and cancel_event.is_set():
+                raise yt_dlp.utils.DownloadCancelled("Download annullato")
 
+        ydl_opts = {
+            'format': 'bestaudio[ext=m4a]/bestaudio/best',
+            'outtmpl': output_base + '.src.%(ext)s',
+            'noplaylist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'socket_timeout': 30,
+            'progress_hooks': [check_cancel],
+            'postprocessor_hooks': [check_cancel],
+        }
 
-def cleanup_cache():
-    """Pulisce la cache se supera il limite"""
-    try:
-        if not os.path.exists(MUSIC_CACHE_DIR):
-            return
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            logger.bind(tag=TAG).info(f"Download da YouTube: {video_url}")
+            info = ydl.extract_info(video_url, download=True)
+            path = ydl.prepare_filename(info)
+        return path if os.path.exists(path) else None
 
-        files = []
-        total_size = 0
-        for f in Path(MUSIC_CACHE_DIR).glob("*.mp3"):
-            size = f.stat().st_size
-            mtime = f.stat().st_mtime
-            files.append((f, size, mtime))
-            total_size += size
-
-        # Se supera il limite, rimuovi i file più vecchi
-        max_bytes = MAX_CACHE_SIZE_MB * 1024 * 1024
-        if total_size > max_bytes:
-            # Ordina per data (più vecchi prima)
-            files.sort(key=lambda x: x[2])
-            while total_size > max_bytes * 0.7 and files:  # Riduci al 70%
-                f, size, _ = files.pop(0)
-                f.unlink()
-                total_size -= size
-                logger.bind(tag=TAG).info(f"Cache cleanup: rimosso {f}")
     except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore cleanup cache: {e}")
+        if cancel_event is not None and cancel_event.is_set():
+            logger.bind(tag=TAG).info(f"Download annullato: {video_url}")
+        else:
+            logger.bind(tag=TAG).error(f"Errore download YouTube: {e}")
+        return None
 
 
-def download_from_youtube(query: str, output_path: str) -> bool:
-    """Scarica audio da YouTube usando yt-dlp"""
+def resolve_audio_stream(query: str) -> dict:
+    """Cerca su YouTube e restituisce l'URL diretto del miglior formato audio, senza scaricare"""
     try:
         import yt_dlp
 
         ydl_opts = {
             'format': 'bestaudio[ext=m4a]/bestaudio/best',
-            'outtmpl': output_path.replace('.mp3', '.%(ext)s'),
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '128',  # 128kbps per file piccoli
-            }],
             'noplaylist': True,
             'quiet': True,
             'no_warnings': True,
-            'default_search': 'ytsearch1',  # Cerca e prendi il primo risultato
             'socket_timeout': 30,
         }
 
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Cerca e scarica
-            logger.bind(tag=TAG).info(f"Cercando su YouTube: {query}")
-            info = ydl.extract_info(f"ytsearch1:{query}", download=True)
+            logger.bind(tag=TAG).info(f"Risoluzione stream YouTube: {query}")
+            info = ydl.extract_info(f"ytsearch1:{query}", download=False)
 
-            if info and 'entries' in info and info['entries']:
+            if info and info.get('entries'):
                 video_info = info['entries'][0]
-                title = video_info.get('title', query)
-                logger.bind(tag=TAG).info(f"Scaricato: {title}")
-                return True, title
+                if video_info.get('id') and video_info.get('url'):
+                    return {
+                        "id": video_info['id'],
+                        "title": video_info.get('title', query),
+                        "artist": video_info.get('artist') or video_info.get('creator')
+                        or (video_info.get('channel') or '').removesuffix(' - Topic'),
+                        "url": video_info['url'],
+                        "webpage_url": video_info.get('webpage_url')
+                        or f"https://www.youtube.com/watch?v={video_info['id']}",
+                        "headers": video_info.get('http_headers', {}),
+                    }
+
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"Errore risoluzione YouTube: {e}")
+    return None
+
 
-        return False, None
+def find_related(stream: dict) -> list:
+    """Altri video dello stesso artista (solo metadati, nessun download)"""
+    artist = stream.get("artist")
+    if not artist:
+        return []
+    try:
+        import yt_dlp
+
+        ydl_opts = {
+            'extract_flat': 'in_playlist',
+            'quiet': True,
+            'no_warnings': True,
+            'socket_timeout': 30,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(f"ytsearch{PREFETCH_TRACKS + 3}:{artist}", download=False)
+
+        related = []
+        for entry in (info or {}).get('entries') or []:
+            if entry.get('id') and entry['id'] != stream["id"]:
+                related.append({
+                    "id": entry['id'],
+                    "title": entry.get('title', artist),
+                    "webpage_url": f"https://www.youtube.com/watch?v={entry['id']}",
+                })
+        return related
 
     except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore download YouTube: {e}")
-        return False, None
+        logger.bind(tag=TAG).warning(f"Errore ricerca brani correlati: {e}")
+        return []
+
 
+def progressive_cmd(stream: dict) -> list:
+    """ffmpeg che decodifica lo stream audio remoto in PCM su stdout"""
+    return [
+        "ffmpeg",
+        "-loglevel", "error",
+        *ffmpeg_input_args(stream["url"], stream["headers"]),
+        *ffmpeg_pcm_output_args(),
+    ]
 
-@register_function("cerca_musica", CERCA_MUSICA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
-def cerca_musica(conn, query: str):
+
+@register_async_function("cerca_musica", CERCA_MUSICA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
+async def cerca_musica(conn, query: str):
     """Cerca e riproduce musica da YouTube"""
 
     if not query:
@@ -137,19 +212,25 @@ def cerca_musica(conn, query: str):
 
     logger.bind(tag=TAG).info(f"Richiesta musica: {query}")
 
-    # Controlla cache
-    cached_path = check_cache(query)
-    if cached_path:
+    # Sostituisce musica o radio già in riproduzione
+    cancel_media(conn)
+
+    # Prima la libreria locale: nessun download (trigrammi e difflib in un thread, non sulla loop)
+    local = await asyncio.to_thread(music_library.search, query)
+    if local:
+        song_name = f"{local['artist']} - {local['title']}" if local["artist"] else local["title"]
+        track_task(conn, play_downloaded_music(conn, local["path"], song_name))
+        return ActionResponse(Action.NONE, "Riproduzione dalla libreria locale", f"Riproduco {song_name}...")
+
+    # Controlla cache (query normalizzata, lookup in memoria)
+    cached = music_cache.lookup(query)
+    if cached:
         # Avvia riproduzione da cache in background
-        conn.loop.create_task(play_downloaded_music(conn, cached_path, query))
+        track_task(conn, play_downloaded_music(conn, cached["path"], cached["title"] or query))
         return ActionResponse(Action.NONE, "Riproduzione da cache", f"Riproduco {query}...")
 
-    # Pulisci cache se necessario
-    cleanup_cache()
-
-    # Scarica in background e riproduci
-    output_path = get_cache_path(query)
-    conn.loop.create_task(download_and_play(conn, query, output_path))
+    # Cerca, scarica in background e riproduci
+    track_task(conn, search_and_play(conn, query))
 
     return ActionResponse(
         Action.REQLLM,
@@ -158,29 +239,233 @@ def cerca_musica(conn, query: str):
     )
 
 
-async def download_and_play(conn, query: str, output_path: str):
-    """Scarica da YouTube e riproduci (async)"""
+async def search_and_play(conn, query: str):
+    """Risolve la query in un video; se il video è già in cache lo riproduce, altrimenti lo scarica"""
     try:
-        # Avvisa l'utente
         await send_stt_message(conn, f"Cerco {query} su YouTube...")
 
-        # Scarica (in thread separato per non bloccare)
         loop = asyncio.get_event_loop()
-        success, title = await loop.run_in_executor(
-            None,
+        stream = await loop.run_in_executor(None, resolve_audio_stream, query)
+        if not stream:
+            await send_stt_message(conn, f"Non ho trovato {query} su YouTube")
+            return
+
+        # Query diversa ma stesso video: condivide il file già in cache
+        music_cache.remember_query(query, stream["id"])
+        prefetch_budget.consumed(_device_key(conn), stream["id"])
+        cached = music_cache.lookup_video(stream["id"])
+        if cached:
+            await play_downloaded_music(conn, cached["path"], stream["title"])
+        else:
+            await fetch_coalesced(conn, stream)
+
+        schedule_prefetch(conn, stream)
+
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"Errore search_and_play: {e}")
+        await send_stt_message(conn, "Errore durante la ricerca della musica")
+
+
+def _device_key(conn) -> str:
+    return getattr(conn, "device_id", None) or conn.session_id
+
+
+def schedule_prefetch(conn, stream: dict):
+    """
+    Anticipa in background i prossimi brani probabili. Non è legato alla riproduzione
+    corrente: una nuova richiesta non lo annulla, anzi si aggancia al download in corso
+    """
+    if not MUSIC_PREFETCH or not stream.get("artist"):
+        return
+    device = _device_key(conn)
+    if not prefetch_budget.allow(device):
+        return
+    # I brani anticipati per questa connessione non devono pesare su una riconnessione
+    on_disconnect(conn, "prefetch", lambda _conn: prefetch_budget.disconnected(device))
+    task = conn.loop.create_task(prefetch_related(device, stream))
+    _prefetch_tasks.add(task)
+    task.add_done_callback(_prefetch_tasks.discard)
+
+
+async def prefetch_related(device: str, stream: dict):
+    try:
+        loop = asyncio.get_event_loop()
+        related = await loop.run_in_executor(None, find_related, stream)
+        fetched = 0
+        for candidate in related:
+            if fetched >= PREFETCH_TRACKS or not prefetch_budget.allow(device):
+                break
+            # Solo a risorse libere: le richieste degli utenti hanno sempre la precedenza
+            if supervisor.free_slots() < 2:
+                logger.bind(tag=TAG).debug("Prefetch rinviato: supervisore occupato")
+                break
+            if music_cache.lookup_video(candidate["id"]) or downloads.in_flight(candidate["id"]):
+                continue
+            try:
+                if await downloads.do_async(candidate["id"], prefetch_track, device, candidate):
+                    fetched += 1
+            except FlightAbandoned:
+                break
+    except Exception as e:
+        logger.bind(tag=TAG).warning(f"Errore prefetch: {e}")
+
+
+async def prefetch_track(device: str, candidate: dict) -> bool:
+    """Scarica e converte un brano in cache senza riprodurlo"""
+    output_path = music_cache.path_for(candidate["id"])
+    source_path = None
+    try:
+        source_path = await supervisor.run_in_thread(
+            "prefetch", download_from_youtube, candidate["webpage_url"], os.path.splitext(output_path)[0]
+        )
+        if not source_path:
+            return False
+        downloaded = os.path.getsize(source_path)
+        if not await transcode_to_opus_file(source_path, output_path, kind="prefetch"):
+            return False
+        music_cache.add_file(candidate["id"], output_path, candidate["title"])
+        prefetch_budget.record(device, candidate["id"], downloaded, os.path.getsize(output_path))
+        logger.bind(tag=TAG).info(f"Prefetch completato: {candidate['title']}")
+        return True
+    except SupervisorBusy:
+        return False
+    finally:
+        if source_path and os.path.exists(source_path):
+            os.remove(source_path)
+
+
+async def fetch_coalesced(conn, stream: dict, retry: bool = True):
+    """
+    Scarica il video una sola volta: il primo richiedente lo scarica (e lo ascolta
+    subito in modalità progressiva), gli altri attendono e riproducono il file in cache
+    """
+    video_id = stream["id"]
+    output_path = music_cache.path_for(video_id)
+    leader = False
+
+    async def fill():
+        nonlocal leader
+        leader = True
+        if MUSIC_PROGRESSIVE:
+            await stream_and_cache(conn, stream, output_path)
+        else:
+            await download_and_play(conn, stream, output_path)
+
+    if downloads.in_flight(video_id):
+        await send_stt_message(conn, f"Sto già scaricando {stream['title']}, un attimo...")
+
+    try:
+        await downloads.do_async(video_id, fill)
+    except FlightAbandoned:
+        pass
+    if leader:
+        return
+
+    cached = music_cache.lookup_video(video_id)
+    if cached:
+        await play_downloaded_music(conn, cached["path"], stream["title"])
+    elif retry:
+        # Chi scaricava si è fermato prima della fine: riprova diventando il primo
+        await fetch_coalesced(conn, stream, retry=False)
+    else:
+        await send_stt_message(conn, f"Non riesco a scaricare {stream['title']}")
+
+
+async def stream_and_cache(conn, stream: dict, output_path: str):
+    """Riproduce mentre scarica: l'audio parte ai primi frame, i pacchetti finiscono in cache"""
+    writer = None
+    process = None
+    playing = False
+    try:
+        process = await supervisor.spawn(
+            "music",
+            progressive_cmd(stream),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        track_process(conn, process)
+
+        first_chunk = await asyncio.wait_for(process.stdout.read(FRAME_BYTES), timeout=FIRST_AUDIO_TIMEOUT)
+        if not first_chunk:
+            await send_stt_message(conn, f"Non riesco a riprodurre {stream['title']}")
+            return
+
+        text = f"Ecco a te: {stream['title']}"
+        await send_stt_message(conn, text)
+        conn.dialogue.put(Message(role="assistant", content=text))
+        start_playback(conn)
+        playing = True
+        logger.bind(tag=TAG).info(f"Riproduzione progressiva: {stream['title']}")
+
+        writer = OpusFrameWriter(output_path)
+        await stream_process_to_conn(conn, process, initial=first_chunk, sink=writer.write)
+        if not process.stdout.at_eof():
+            # Connessione chiusa a metà brano: ffmpeg resterebbe fermo sulla pipe piena,
+            # quindi niente wait (lo termina il finally) e niente cache di un file incompleto
+            return
+        await process.wait()
+
+        if process.returncode == 0 and await writer.commit():
+            music_cache.add_file(stream["id"], output_path, stream["title"])
+            logger.bind(tag=TAG).info(f"Salvato in cache: {output_path}")
+
+    except asyncio.TimeoutError:
+        await send_stt_message(conn, f"Non riesco a riprodurre {stream['title']}")
+    except SupervisorBusy as e:
+        logger.bind(tag=TAG).warning(f"Download non ammesso: {e}")
+        await send_stt_message(conn, "Troppe richieste audio in corso, riprova tra poco")
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"Errore stream_and_cache: {e}")
+        await send_stt_message(conn, "Errore durante la riproduzione della musica")
+    finally:
+        if process is not None:
+            await kill_process(process)
+            untrack_process(conn, process)
+        if playing:
+            end_playback(conn)
+        if writer is not None:
+            writer.abort()
+
+
+async def download_and_play(conn, stream: dict, output_path: str):
+    """Scarica da YouTube, converte in pacchetti Opus e riproduci (async)"""
+    cancel_event = threading.Event()
+    track_cancel_event(conn, cancel_event)
+    source_path = None
+    try:
+        # Scarica nel pool media a bassa priorità (con coda e limite di concorrenza)
+        source_path = await supervisor.run_in_thread(
+            "music",
             download_from_youtube,
-            query,
-            output_path
+            stream["webpage_url"],
+            os.path.splitext(output_path)[0],
+            cancel_event
         )
 
-        if success and os.path.exists(output_path):
-            await play_downloaded_music(conn, output_path, title or query)
-        else:
-            await send_stt_message(conn, f"Non ho trovato {query} su YouTube")
+        if cancel_event.is_set():
+            return
 
+        if source_path and await transcode_to_opus_file(source_path, output_path):
+            music_cache.add_file(stream["id"], output_path, stream["title"])
+            await play_downloaded_music(conn, output_path, stream["title"])
+        else:
+            await send_stt_message(conn, f"Non riesco a scaricare {stream['title']}")
+
+    except asyncio.CancelledError:
+        # Il thread di download si ferma al prossimo progress hook
+        cancel_event.set()
+        raise
+    except SupervisorBusy as e:
+        logger.bind(tag=TAG).warning(f"Download non ammesso: {e}")
+        await send_stt_message(conn, "Troppe richieste audio in corso, riprova tra poco")
     except Exception as e:
         logger.bind(tag=TAG).error(f"Errore download_and_play: {e}")
         await send_stt_message(conn, "Errore durante il download della musica")
+    finally:
+        untrack_cancel_event(conn, cancel_event)
+        if source_path and os.path.exists(source_path):
+            os.remove(source_path)
 
 
 async def play_downloaded_music(conn, music_path: str, song_name: str):
@@ -195,6 +480,16 @@ async def play_downloaded_music(conn, music_path: str, song_name: str):
         await send_stt_message(conn, text)
         conn.dialogue.put(Message(role="assistant", content=text))
 
+        if is_opus_cache_file(music_path):
+            # Pacchetti già nel formato del dispositivo: nessuna decodifica
+            start_playback(conn)
+            logger.bind(tag=TAG).info(f"Riproduzione avviata: {music_path}")
+            try:
+                await play_opus_file(conn, music_path)
+            finally:
+                end_playback(conn)
+            return
+
         # Invia alla coda TTS per riproduzione
         if conn.intent_type == "intent_llm":
             conn.tts.tts_text_queue.put(
@@ -0,0 +1,317 @@
+"""
+HTTP Client - Client HTTP condiviso da tutti i plugin
+Una sola sessione requests con pool di connessioni per host e keep-alive, timeout
+e retry uniformi, cache DNS con TTL usata solo dalle sue connessioni e, se httpx è
+installato, un client asincrono equivalente (HTTP/2 se è presente h2).
+http_stats() riporta quante richieste hanno riusato una connessione già aperta
+(nel log periodico di plugin_setup). Importare il modulo non ha effetti sul resto
+del processo
+"""
+
+import time
+import socket
+import asyncio
+import weakref
+import ipaddress
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from config.logger import setup_logging
+
+try:
+    import httpx
+    import httpcore
+except ImportError:
+    httpx = httpcore = None
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+TAG = __name__
+logger = setup_logging()
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+POOL_HOSTS = 32  # Host con un pool dedicato
+POOL_SIZE = 16  # Connessioni tenute aperte per host
+RETRIES = 2  # Nuovi tentativi su errori di connessione e 502/503/504
+RETRY_BACKOFF = 0.3
+DNS_TTL = 300  # Secondi di validità di una risoluzione DNS in cache
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+# ---------------------------------------------------------------- DNS cache
+# Solo le connessioni aperte da questo client passano dalla cache: socket.getaddrinfo
+# del processo non viene toccato
+
+_dns_lock = threading.Lock()
+_dns_cache = {}  # host -> (scadenza, indirizzo)
+_dns_stats = {"hits": 0, "misses": 0}
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _cached(host: str):
+    """Indirizzo in cache e ancora valido, o None"""
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(host)
+        if entry is not None and entry[0] > now:
+            _dns_stats["hits"] += 1
+            return entry[1]
+    return None
+
+
+def _store(host: str, infos: list) -> str:
+    address = infos[0][4][0]
+    with _dns_lock:
+        _dns_cache[host] = (time.monotonic() + DNS_TTL, address)
+        _dns_stats["misses"] += 1
+    return address
+
+
+def _forget_address(host: str):
+    """Connessione fallita verso l'indirizzo in cache: la prossima volta si risolve di nuovo"""
+    with _dns_lock:
+        _dns_cache.pop(host, None)
+
+
+def _resolve(host: str):
+    """Indirizzo dell'host dalla cache o dal resolver; None lascia risolvere alla connessione"""
+    if not host or _is_ip(host):
+        return None
+    address = _cached(host)
+    if address is not None:
+        return address
+    try:
+        return _store(host, socket.getaddrinfo(host, None, type=socket.SOCK_STREAM))
+    except OSError:
+        return None  # L'errore lo riporta la connessione normale
+
+
+async def _resolve_async(host: str):
+    if not host or _is_ip(host):
+        return None
+    address = _cached(host)
+    if address is not None:
+        return address
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        return _store(host, infos)
+    except OSError:
+        return None
+
+
+class _CachedDNSConnectionMixin:
+    """Connessione urllib3 che apre il socket verso l'indirizzo in cache"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        address = _resolve(host.rstrip("."))
+        if address is None:
+            return super()._new_conn()
+        # _dns_host è l'host usato solo per il connect: SNI e Host restano quelli originali
+        self._dns_host = address
+        try:
+            return super()._new_conn()
+        except Exception:
+            _forget_address(host.rstrip("."))
+            raise
+        finally:
+            self._dns_host = host
+
+
+class _CachedDNSHTTPConnection(_CachedDNSConnectionMixin, HTTPConnection):
+    pass
+
+
+class _CachedDNSHTTPSConnection(_CachedDNSConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CachedDNSHTTPConnection
+
+
+class _CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CachedDNSHTTPSConnection
+
+
+class _CachedDNSAdapter(HTTPAdapter):
+    """HTTPAdapter i cui pool usano la cache DNS (solo connessioni dirette, non via proxy)"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CachedDNSHTTPConnectionPool,
+            "https": _CachedDNSHTTPSConnectionPool,
+        }
+
+
+if httpcore is not None:
+    class _CachedDNSBackend(httpcore.AsyncNetworkBackend):
+        """Backend di rete httpcore che si connette all'indirizzo in cache (SNI invariato)"""
+
+        def __init__(self, backend):
+            self._backend = backend
+
+        async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+            address = await _resolve_async(host)
+            try:
+                return await self._backend.connect_tcp(
+                    address or host, port, timeout=timeout, local_address=local_address, socket_options=socket_options,
+                )
+            except Exception:
+                if address is not None:
+                    _forget_address(host)
+                raise
+
+        async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+            return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+        async def sleep(self, seconds):
+            await self._backend.sleep(seconds)
+
+# ---------------------------------------------------------------- client sincrono
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=0,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        raise_on_status=False,
+    )
+    adapter = _CachedDNSAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE, max_retries=retry)
+    http = requests.Session()
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+    http.headers["User-Agent"] = USER_AGENT
+    return http
+
+
+session = _build_session()
+
+
+def http_request(method: str, url: str, **kwargs) -> requests.Response:
+    """Come requests.request, sulla sessione condivisa e con il timeout predefinito"""
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return session.request(method, url, **kwargs)
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    return http_request("GET", url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> requests.Response:
+    return http_request("POST", url, **kwargs)
+
+# ---------------------------------------------------------------- client asincrono
+
+# loop -> httpx.AsyncClient (un client è legato alla sua loop); le loop chiuse spariscono da sole
+_async_clients = weakref.WeakKeyDictionary()
+_async_requests = 0
+
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # Con transport= esplicito httpx ignora limits e http2 del client: vanno al transport
+        transport = httpx.AsyncHTTPTransport(
+            retries=RETRIES,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=POOL_HOSTS * POOL_SIZE, max_keepalive_connections=POOL_SIZE * 4),
+        )
+        # httpx non espone il backend di rete: la cache DNS si aggancia al pool httpcore
+        pool = getattr(transport, "_pool", None)
+        if hasattr(pool, "_network_backend"):
+            pool._network_backend = _CachedDNSBackend(pool._network_backend)
+        client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            transport=transport,
+            follow_redirects=True,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Chiude il client della loop corrente: da chiamare prima di chiudere una loop temporanea"""
+    if httpx is None:
+        return
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def http_request_async(method: str, url: str, **kwargs):
+    """
+    Versione asincrona di http_request. Con httpx usa il client della loop corrente,
+    altrimenti esegue la richiesta sincrona in un thread (stessa sessione e pool)
+    """
+    global _async_requests
+    if httpx is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: http_request(method, url, **kwargs))
+
+    timeout = kwargs.pop("timeout", None)
+    if isinstance(timeout, tuple):
+        kwargs["timeout"] = httpx.Timeout(timeout[1], connect=timeout[0])
+    elif timeout is not None:
+        kwargs["timeout"] = timeout
+    _async_requests += 1
+    return await _async_client().request(method, url, **kwargs)
+
+
+async def http_get_async(url: str, **kwargs):
+    return await http_request_async("GET", url, **kwargs)
+
+
+async def http_post_async(url: str, **kwargs):
+    return await http_request_async("POST", url, **kwargs)
+
+
+# ---------------------------------------------------------------- metriche
+
+
+def http_stats() -> dict:
+    """Connessioni aperte e richieste servite per host: riuso = 1 - connessioni/richieste"""
+    hosts = {}
+    adapter = session.get_adapter("https://")
+    for key in list(adapter.poolmanager.pools.keys()):
+        pool = adapter.poolmanager.pools.get(key)
+        if pool is None or not pool.num_requests:
+            continue
+        hosts[f"{pool.scheme}://{pool.host}"] = {
+            "connections": pool.num_connections,
+            "requests": pool.num_requests,
+            "reuse": round(1 - pool.num_connections / pool.num_requests, 2),
+        }
+    with _dns_lock:
+        dns = dict(_dns_stats, cached=len(_dns_cache))
+    return {
+        "hosts": hosts,
+        "dns": dns,
+        "async": {"backend": "httpx" if httpx is not None else "thread", "http2": HTTP2_AVAILABLE,
+                  "requests": _async_requests, "clients": len(_async_clients)},
+    }
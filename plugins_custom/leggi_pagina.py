@@ -2,10 +2,20 @@
 Leggi Pagina Plugin - Legge e riassume il contenuto di una pagina web
 """
 
-import requests
 import re
+import time
+import asyncio
+import codecs
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from config.logger import setup_logging
-from plugins_func.register import register_function, ToolType, ActionResponse, Action
+from plugins_func.register import ToolType, ActionResponse, Action
+from plugins_func.functions.async_plugins import register_async_function
+from plugins_func.functions.page_extractor import make_extractor
+from plugins_func.functions.http_client import http_get
+from plugins_func.functions.session_store import SessionStore, session_key
+from plugins_func.functions.single_flight import SingleFlight
+from plugins_func.functions.summarizer import summarize, estimate_tokens
 
 TAG = __name__
 logger = setup_logging()
@@ -31,6 +41,10 @@ LEGGI_PAGINA_FUNCTION_DESC = {
                     "type": "integer",
                     "description": "Numero del risultato dalla ricerca precedente (1, 2, 3...)",
                 },
+                "domanda": {
+                    "type": "string",
+                    "description": "Cosa vuole sapere l'utente dalla pagina, se l'ha detto",
+                },
             },
             "required": [],
         },
@@ -41,64 +55,83 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 }
 
-# Cache per salvare gli ultimi risultati di ricerca
-last_search_results = {}
-
-
-def clean_html(html: str) -> str:
-    """Rimuove tag HTML e pulisce il testo"""
-    # Rimuovi script e style
-    html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
-    html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL | re.IGNORECASE)
-    html = re.sub(r'<nav[^>]*>.*?</nav>', '', html, flags=re.DOTALL | re.IGNORECASE)
-    html = re.sub(r'<footer[^>]*>.*?</footer>', '', html, flags=re.DOTALL | re.IGNORECASE)
-    html = re.sub(r'<header[^>]*>.*?</header>', '', html, flags=re.DOTALL | re.IGNORECASE)
-
-    # Rimuovi tutti i tag HTML
-    text = re.sub(r'<[^>]+>', ' ', html)
-
-    # Pulisci spazi multipli
-    text = re.sub(r'\s+', ' ', text)
-
-    # Rimuovi caratteri speciali HTML
-    text = text.replace('&nbsp;', ' ')
-    text = text.replace('&amp;', '&')
-    text = text.replace('&lt;', '<')
-    text = text.replace('&gt;', '>')
-    text = text.replace('&quot;', '"')
-
-    return text.strip()
+# Limiti di lettura: oltre questi byte (decompressi) o secondi la pagina viene troncata
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+FETCH_DEADLINE = 15
+CHUNK_SIZE = 16 * 1024
+
+# Testo estratto dalla pagina e token massimi inviati all'LLM dopo il riassunto estrattivo
+PAGE_TEXT_CHARS = 10000
+SUMMARY_TOKEN_BUDGET = 400
+
+# Lettura anticipata dei primi risultati di web_search, per un "leggi il primo" immediato
+PREFETCH_RESULTS = 3  # 0 = disattivata
+PREFETCH_TTL = 300  # Secondi di validità del testo letto in anticipo
+PREFETCH_WORKERS = 4
+PREFETCH_MAX_SESSIONS = 500  # Sessioni con pagine in memoria (~60 KB ciascuna al massimo)
+
+# Testo già estratto per sessione: url -> contenuto
+prefetched_pages = SessionStore(
+    "pagine", ttl=PREFETCH_TTL, max_items=PREFETCH_RESULTS * 2 or 1, max_sessions=PREFETCH_MAX_SESSIONS
+)
+# Una sola lettura per url: leggi_pagina si aggancia alla lettura anticipata in corso
+page_fetches = SingleFlight("page_fetch")
+_prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="page-prefetch")
+
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+def _detect_charset(response, head: bytes) -> str:
+    """Charset dichiarato dall'header HTTP o dal meta nei primi byte, altrimenti utf-8"""
+    content_type = response.headers.get("Content-Type", "")
+    match = re.search(r'charset=["\']?([\w-]+)', content_type, re.IGNORECASE)
+    if not match:
+        match = _META_CHARSET_RE.search(head)
+    charset = match.group(1) if match else "utf-8"
+    if isinstance(charset, bytes):
+        charset = charset.decode("ascii", "ignore")
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = "utf-8"
+    return charset
 
 
-def fetch_page_content(url: str, max_chars: int = 4000) -> str:
-    """Scarica e pulisce il contenuto di una pagina web"""
+def fetch_page_content(url: str, max_chars: int = PAGE_TEXT_CHARS) -> str:
+    """Scarica la pagina in streaming (con limite di byte) e ne estrae il testo principale"""
     try:
         # Aggiungi https se mancante
         if not url.startswith('http'):
             url = 'https://' + url
 
-        response = requests.get(url, headers=HEADERS, timeout=15)
-        response.raise_for_status()
-
-        # Prova a usare BeautifulSoup se disponibile
-        try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Rimuovi elementi non utili
-            for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe']):
-                tag.decompose()
-
-            # Cerca il contenuto principale
-            main_content = soup.find('main') or soup.find('article') or soup.find('div', {'class': re.compile(r'content|article|post|entry')})
-
-            if main_content:
-                text = main_content.get_text(separator=' ', strip=True)
+        deadline = time.monotonic() + FETCH_DEADLINE
+        with http_get(url, headers=HEADERS, timeout=(5, FETCH_DEADLINE), stream=True) as response:
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "text/html").lower()
+            if "html" not in content_type and "text" not in content_type:
+                return "Errore: il link non porta a una pagina web leggibile"
+
+            extractor = make_extractor(max_chars)
+            decoder = None
+            received = 0
+            truncated = False
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(_detect_charset(response, chunk))(errors="replace")
+                received += len(chunk)
+                extractor.feed(decoder.decode(chunk))
+                if extractor.enough or received >= MAX_PAGE_BYTES or time.monotonic() > deadline:
+                    truncated = not extractor.enough
+                    break
             else:
-                text = soup.get_text(separator=' ', strip=True)
+                if decoder is not None:
+                    extractor.feed(decoder.decode(b"", final=True))
+            extractor.close()
 
-        except ImportError:
-            text = clean_html(response.text)
+        if truncated:
+            logger.bind(tag=TAG).info(f"Pagina troncata a {received} byte: {url}")
+        text = extractor.text()
 
         # Limita lunghezza
         if len(text) > max_chars:
@@ -113,29 +146,48 @@ def fetch_page_content(url: str, max_chars: int = 4000) -> str:
         return f"Errore nel recuperare la pagina: {str(e)[:100]}"
 
 
-def save_search_results(conn_id: str, results: list):
-    """Salva i risultati di ricerca per uso futuro"""
-    last_search_results[conn_id] = results
+def read_page(session: str, url: str) -> str:
+    """Testo della pagina: dalla lettura anticipata se disponibile, altrimenti scaricato ora"""
+    content = prefetched_pages.get(session, url)
+    if content is not None:
+        logger.bind(tag=TAG).info(f"Pagina già letta in anticipo: {url}")
+        return content
+    content = page_fetches.do(url, fetch_page_content, url)
+    if not content.startswith("Errore"):
+        prefetched_pages.put(session, url, content)
+    return content
 
 
-def get_saved_result(numero: int) -> str:
-    """Recupera un URL dai risultati salvati di web_search"""
+def _prefetch_page(session: str, url: str):
     try:
-        from plugins_func.functions.web_search import last_search_results
-        if 0 < numero <= len(last_search_results):
-            return last_search_results[numero - 1].get('url', '')
+        read_page(session, url)
     except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore recupero risultato: {e}")
-    return ''
+        logger.bind(tag=TAG).warning(f"Errore lettura anticipata {url}: {e}")
+
+
+def prefetch_pages(conn, results: list):
+    """Avvia in background la lettura dei primi risultati di una ricerca"""
+    session = session_key(conn)
+    for result in results[:PREFETCH_RESULTS]:
+        url = result.get("url")
+        if url and prefetched_pages.get(session, url) is None:
+            _prefetch_executor.submit(_prefetch_page, session, url)
+
 
+def get_saved_result(conn, numero: int) -> str:
+    """Recupera un URL dall'ultima ricerca web_search di questa sessione"""
+    from plugins_func.functions.web_search import get_search_result
+    result = get_search_result(conn, numero)
+    return result.get('url', '') if result else ''
 
-@register_function("leggi_pagina", LEGGI_PAGINA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
-def leggi_pagina(conn, url: str = None, numero_risultato: int = None):
+
+@register_async_function("leggi_pagina", LEGGI_PAGINA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
+async def leggi_pagina(conn, url: str = None, numero_risultato: int = None, domanda: str = None):
     """Legge e riassume il contenuto di una pagina web"""
 
     # Se è specificato un numero, recupera l'URL dai risultati precedenti
     if numero_risultato and not url:
-        url = get_saved_result(numero_risultato)
+        url = get_saved_result(conn, numero_risultato)
         if not url:
             return ActionResponse(
                 Action.REQLLM,
@@ -152,33 +204,17 @@ def leggi_pagina(conn, url: str = None, numero_risultato: int = None):
 
     logger.bind(tag=TAG).info(f"Lettura pagina: {url}")
 
-    content = fetch_page_content(url)
+    # Download, estrazione e riassunto sono bloccanti: fuori dalla loop
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(None, read_page, session_key(conn), url)
 
     if content.startswith("Errore"):
         return ActionResponse(Action.REQLLM, content, None)
 
-    result = f"📄 **Contenuto da {url[:50]}...**\n\n{content}\n\n---\nRiassumi o rispondi alle domande dell'utente basandoti su questo contenuto."
-
-    return ActionResponse(Action.REQLLM, result, None)
+    # Solo le frasi più rilevanti (per la domanda, se c'è): meno token e meno latenza
+    summary = await loop.run_in_executor(None, summarize, content, domanda, SUMMARY_TOKEN_BUDGET)
+    logger.bind(tag=TAG).info(f"Riassunto: {estimate_tokens(content)} -> {estimate_tokens(summary)} token")
 
+    result = f"📄 **Contenuto da {url[:50]}...**\n\n{summary}\n\n---\nRiassumi o rispondi alle domande dell'utente basandoti su questo contenuto."
 
-# Patch web_search per salvare i risultati
-def patch_web_search():
-    """Modifica web_search per salvare i risultati"""
-    try:
-        from plugins_func.functions import web_search as ws_module
-        original_search = ws_module.search_duckduckgo
-
-        def patched_search(query, num_results=5, lang="it"):
-            results = original_search(query, num_results, lang)
-            # Salva i risultati globalmente
-            last_search_results['last'] = results
-            return results
-
-        ws_module.search_duckduckgo = patched_search
-        logger.bind(tag=TAG).info("web_search patched per salvare risultati")
-    except Exception as e:
-        logger.bind(tag=TAG).warning(f"Impossibile patchare web_search: {e}")
-
-# Applica patch all'import
-patch_web_search()
+    return ActionResponse(Action.REQLLM, result, None)
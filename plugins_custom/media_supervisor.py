@@ -0,0 +1,228 @@
+"""
+Media Supervisor - Supervisore globale dei processi ffmpeg / yt-dlp
+Tutti i plugin multimediali avviano i transcoder da qui: limite di processi
+contemporanei, coda con controllo di ammissione e priorità ridotta (nice),
+così un picco di richieste radio/musica non toglie CPU ad ASR e TTS.
+Le catture live (radio) non finiscono mai da sole: hanno un limite proprio e
+non occupano i posti dei lavori di download/conversione
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import threading
+from collections import deque, Counter
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+# Lavori multimediali in esecuzione contemporaneamente
+MAX_RUNNING_JOBS = max(2, os.cpu_count() or 2)
+# Catture live contemporanee (decodifica leggera, durata indefinita)
+MAX_STREAM_JOBS = 4 * MAX_RUNNING_JOBS
+# Tipi di lavoro che contano sul limite delle catture live
+STREAM_KINDS = frozenset({"radio", "stream"})
+# Lavori in attesa oltre i quali le nuove richieste vengono rifiutate
+MAX_QUEUED_JOBS = 20
+# Attesa massima in coda (secondi)
+QUEUE_TIMEOUT = 30
+# Priorità dei processi multimediali (0 = normale, 19 = minima)
+MEDIA_NICE = 10
+
+_NICE_BIN = shutil.which("nice")
+
+
+class SupervisorBusy(Exception):
+    """Coda piena o attesa scaduta: il lavoro non è stato ammesso"""
+
+
+def _budget(kind: str) -> str:
+    return "streams" if kind in STREAM_KINDS else "jobs"
+
+
+class _Waiter:
+    def __init__(self, kind: str, wake):
+        self.kind = kind
+        self.budget = _budget(kind)
+        self.wake = wake
+        self.granted = False
+
+
+def _lower_thread_priority():
+    """Su Linux nice è per thread: anche i figli (ffmpeg di yt-dlp) lo ereditano"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), MEDIA_NICE)
+    except (AttributeError, OSError) as e:
+        logger.bind(tag=TAG).warning(f"Impossibile ridurre priorità thread media: {e}")
+
+
+class MediaSupervisor:
+    """
+    Semafori FIFO condivisi tra thread e loop asyncio, con statistiche: uno per
+    i lavori di download/conversione e uno per le catture live (STREAM_KINDS)
+    """
+
+    def __init__(self, max_running: int = MAX_RUNNING_JOBS, max_queued: int = MAX_QUEUED_JOBS,
+                 max_streams: int = MAX_STREAM_JOBS):
+        self.max_running = max_running
+        self.max_streams = max_streams
+        self.max_queued = max_queued
+        self._limits = {"jobs": max_running, "streams": max_streams}
+        self._lock = threading.Lock()
+        self._running = Counter()
+        self._waiters = deque()
+        self._rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_running,
+            thread_name_prefix="media",
+            initializer=_lower_thread_priority,
+        )
+
+    def _enqueue(self, kind: str, wake) -> _Waiter:
+        """Ammette subito se c'è posto, altrimenti mette in coda (chiamare con lock)"""
+        waiter = _Waiter(kind, wake)
+        if self._in_use(waiter.budget) < self._limits[waiter.budget] and not self._queued(waiter.budget):
+            self._running[kind] += 1
+            waiter.granted = True
+            return waiter
+        if len(self._waiters) >= self.max_queued:
+            self._rejected += 1
+            raise SupervisorBusy(f"Coda media piena ({len(self._waiters)} in attesa)")
+        self._waiters.append(waiter)
+        return waiter
+
+    def _in_use(self, budget: str) -> int:
+        return sum(n for kind, n in self._running.items() if _budget(kind) == budget)
+
+    def _queued(self, budget: str) -> int:
+        return sum(1 for waiter in self._waiters if waiter.budget == budget)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Rinuncia all'attesa; False se nel frattempo il posto era già stato assegnato"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            self._rejected += 1
+            return True
+
+    def release(self, kind: str):
+        with self._lock:
+            self._running[kind] -= 1
+            if self._running[kind] <= 0:
+                del self._running[kind]
+            # Il posto liberato va al primo in attesa sullo stesso limite
+            budget = _budget(kind)
+            for waiter in self._waiters:
+                if waiter.budget == budget:
+                    self._waiters.remove(waiter)
+                    waiter.granted = True
+                    self._running[waiter.kind] += 1
+                    waiter.wake()
+                    break
+
+    def acquire_sync(self, kind: str, timeout: float = QUEUE_TIMEOUT):
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(kind, event.set)
+        if waiter.granted:
+            return
+        if not event.wait(timeout) and self._abandon(waiter):
+            raise SupervisorBusy(f"Attesa in coda oltre {timeout}s")
+
+    async def acquire(self, kind: str, timeout: float = QUEUE_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        with self._lock:
+            waiter = self._enqueue(kind, wake)
+        if waiter.granted:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                raise SupervisorBusy(f"Attesa in coda oltre {timeout}s")
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self.release(kind)
+            raise
+
+    @contextmanager
+    def slot_sync(self, kind: str, timeout: float = QUEUE_TIMEOUT):
+        self.acquire_sync(kind, timeout)
+        try:
+            yield
+        finally:
+            self.release(kind)
+
+    @asynccontextmanager
+    async def slot(self, kind: str, timeout: float = QUEUE_TIMEOUT):
+        await self.acquire(kind, timeout)
+        try:
+            yield
+        finally:
+            self.release(kind)
+
+    async def run_in_thread(self, kind: str, func, *args, timeout: float = QUEUE_TIMEOUT):
+        """Esegue un lavoro bloccante (es. yt-dlp) nel pool media a bassa priorità"""
+        async with self.slot(kind, timeout):
+            started = time.monotonic()
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._executor, func, *args)
+            finally:
+                logger.bind(tag=TAG).debug(f"Lavoro {kind} terminato in {time.monotonic() - started:.1f}s")
+
+    async def spawn(self, kind: str, cmd: list, timeout: float = QUEUE_TIMEOUT, **kwargs) -> asyncio.subprocess.Process:
+        """
+        Avvia un processo a priorità ridotta; il posto resta occupato
+        finché il processo non termina
+        """
+        await self.acquire(kind, timeout)
+        try:
+            if _NICE_BIN:
+                cmd = [_NICE_BIN, "-n", str(MEDIA_NICE), *cmd]
+            process = await asyncio.create_subprocess_exec(*cmd, **kwargs)
+        except BaseException:
+            self.release(kind)
+            raise
+        asyncio.get_running_loop().create_task(self._release_on_exit(kind, process))
+        return process
+
+    async def _release_on_exit(self, kind: str, process: asyncio.subprocess.Process):
+        try:
+            await process.wait()
+        finally:
+            self.release(kind)
+
+    def free_slots(self) -> int:
+        """Posti di lavoro liberi senza attesa: i lavori facoltativi partono solo se ce ne sono"""
+        with self._lock:
+            return self.max_running - self._in_use("jobs") - self._queued("jobs")
+
+    def stats(self) -> dict:
+        """Conteggi live dei lavori in esecuzione e in coda"""
+        with self._lock:
+            return {
+                "running": self._in_use("jobs"),
+                "queued": self._queued("jobs"),
+                "streams": self._in_use("streams"),
+                "streams_queued": self._queued("streams"),
+                "running_by_kind": dict(self._running),
+                "queued_by_kind": dict(Counter(w.kind for w in self._waiters)),
+                "rejected": self._rejected,
+                "max_running": self.max_running,
+                "max_streams": self.max_streams,
+                "max_queued": self.max_queued,
+            }
+
+
+supervisor = MediaSupervisor()
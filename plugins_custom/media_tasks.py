@@ -0,0 +1,192 @@
+"""
+Media Tasks - Registro per connessione di task e processi multimediali in corso
+Permette a stop, disconnessione o nuova richiesta di riproduzione di fermare
+davvero il lavoro: cancella i task, termina i processi figli e svuota l'audio in coda
+"""
+
+import asyncio
+import queue
+from config.logger import setup_logging
+from core.providers.tts.dto.dto import SentenceType, ContentType
+
+TAG = __name__
+logger = setup_logging()
+
+# Intervallo di controllo chiusura connessione (secondi)
+DISCONNECT_POLL_INTERVAL = 1.0
+
+# session_id -> {"tasks": set, "processes": set, "cancel_events": set, "on_disconnect": dict, "watcher": Task}
+_registry = {}
+
+
+def _entry(conn) -> dict:
+    entry = _registry.get(conn.session_id)
+    if entry is None:
+        entry = {"tasks": set(), "processes": set(), "cancel_events": set(), "on_disconnect": {}, "watcher": None}
+        _registry[conn.session_id] = entry
+    if entry["watcher"] is None:
+        entry["watcher"] = conn.loop.create_task(_watch_disconnect(conn))
+    return entry
+
+
+def _has_work(entry: dict) -> bool:
+    return bool(entry["tasks"] or entry["processes"] or entry["cancel_events"])
+
+
+def _is_empty(entry: dict) -> bool:
+    """Niente da fermare né da avvisare alla disconnessione: il watcher può uscire"""
+    return not (_has_work(entry) or entry["on_disconnect"])
+
+
+def _on_conn_loop(conn) -> bool:
+    try:
+        return asyncio.get_running_loop() is conn.loop
+    except RuntimeError:
+        return False
+
+
+def track_task(conn, coro) -> asyncio.Task:
+    """
+    Avvia un task multimediale sulla loop della connessione e lo registra.
+    Da un altro thread il task viene creato sulla loop e non viene restituito
+    """
+    if not _on_conn_loop(conn):
+        conn.loop.call_soon_threadsafe(track_task, conn, coro)
+        return None
+    task = conn.loop.create_task(coro)
+    entry = _entry(conn)
+    entry["tasks"].add(task)
+    task.add_done_callback(entry["tasks"].discard)
+    return task
+
+
+def track_process(conn, process):
+    """Registra un processo figlio (asyncio o subprocess.Popen) della connessione"""
+    _entry(conn)["processes"].add(process)
+
+
+def untrack_process(conn, process):
+    entry = _registry.get(conn.session_id)
+    if entry:
+        entry["processes"].discard(process)
+
+
+def on_disconnect(conn, key: str, callback):
+    """
+    Registra callback(conn), chiamata una volta alla chiusura della connessione
+    (non a stop o nuova riproduzione); la stessa chiave registrata più volte vale una
+    """
+    _entry(conn)["on_disconnect"].setdefault(key, callback)
+
+
+def track_cancel_event(conn, event):
+    """Registra un threading.Event che il lavoro in thread controlla per interrompersi"""
+    _entry(conn)["cancel_events"].add(event)
+
+
+def untrack_cancel_event(conn, event):
+    entry = _registry.get(conn.session_id)
+    if entry:
+        entry["cancel_events"].discard(event)
+
+
+def _kill(process):
+    try:
+        if process.returncode is None:
+            process.kill()
+    except ProcessLookupError:
+        pass
+    except Exception as e:
+        logger.bind(tag=TAG).warning(f"Errore terminazione processo: {e}")
+
+
+def flush_pending_audio(conn):
+    """
+    Rimuove dalle code TTS l'audio multimediale non ancora riprodotto.
+    Restano i messaggi ACTION e i testi del turno corrente, così la risposta
+    in arrivo dal LLM viene comunque pronunciata.
+    """
+    text_queue = conn.tts.tts_text_queue
+    kept = []
+    while True:
+        try:
+            message = text_queue.get_nowait()
+        except queue.Empty:
+            break
+        if message.content_type == ContentType.ACTION or (
+            message.content_type == ContentType.TEXT and message.sentence_id == conn.sentence_id
+        ):
+            kept.append(message)
+    for message in kept:
+        text_queue.put(message)
+
+    audio_queue = conn.tts.tts_audio_queue
+    kept = []
+    while True:
+        try:
+            item = audio_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item[0] != SentenceType.MIDDLE:
+            kept.append(item)
+    for item in kept:
+        audio_queue.put(item)
+
+
+def cancel_media(conn, flush: bool = True) -> bool:
+    """
+    Ferma tutto il lavoro multimediale della connessione.
+    Restituisce True se c'era qualcosa in corso.
+    """
+    entry = _registry.get(conn.session_id)
+    active = entry is not None and _has_work(entry)
+
+    if entry is not None:
+        on_loop = _on_conn_loop(conn)
+        for event in list(entry["cancel_events"]):
+            event.set()
+        for process in list(entry["processes"]):
+            _kill(process)
+        for task in list(entry["tasks"]):
+            if on_loop:
+                task.cancel()
+            else:
+                conn.loop.call_soon_threadsafe(task.cancel)
+        entry["cancel_events"].clear()
+        entry["processes"].clear()
+
+    if flush:
+        flush_pending_audio(conn)
+
+    if active:
+        logger.bind(tag=TAG).info(f"Media fermati per sessione {conn.session_id}")
+    return active
+
+
+def media_stats() -> dict:
+    """Task e processi multimediali registrati per sessione"""
+    return {
+        session_id: {"tasks": len(e["tasks"]), "processes": len(e["processes"])}
+        for session_id, e in _registry.items()
+    }
+
+
+async def _watch_disconnect(conn):
+    """Alla chiusura della connessione ferma tutto; esce quando non resta nulla da seguire"""
+    while True:
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+        entry = _registry.get(conn.session_id)
+        if entry is None:
+            return
+        if conn.stop_event.is_set():
+            cancel_media(conn, flush=False)
+            _registry.pop(conn.session_id, None)
+            for key, callback in entry["on_disconnect"].items():
+                try:
+                    callback(conn)
+                except Exception as e:
+                    logger.bind(tag=TAG).error(f"Errore chiusura {key}: {e}")
+            return
+        if _is_empty(entry):
+            _registry.pop(conn.session_id, None)
+            return
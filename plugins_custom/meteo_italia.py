@@ -3,9 +3,10 @@ Meteo Italia Plugin - Funziona per TUTTE le città italiane (anche Asti!)
 Usa Open-Meteo (gratuito, senza API key)
 """
 
-import requests
 from config.logger import setup_logging
-from plugins_func.register import register_function, ToolType, ActionResponse, Action
+from plugins_func.register import ToolType, ActionResponse, Action
+from plugins_func.functions.http_client import http_get_async
+from plugins_func.functions.async_plugins import register_async_function
 
 TAG = __name__
 logger = setup_logging()
@@ -43,11 +44,11 @@ WMO_CODES = {
 }
 
 
-def geocode_city(city: str) -> dict:
+async def geocode_city(city: str) -> dict:
     try:
         url = "https://geocoding-api.open-meteo.com/v1/search"
         params = {"name": city, "count": 3, "language": "it"}
-        response = requests.get(url, params=params, timeout=10)
+        response = await http_get_async(url, params=params)
         data = response.json()
 
         if not data.get("results"):
@@ -67,7 +68,7 @@ def geocode_city(city: str) -> dict:
         return None
 
 
-def get_weather(lat: float, lon: float) -> dict:
+async def get_weather(lat: float, lon: float) -> dict:
     try:
         url = "https://api.open-meteo.com/v1/forecast"
         params = {
@@ -76,22 +77,22 @@ def get_weather(lat: float, lon: float) -> dict:
             "daily": ["weather_code", "temperature_2m_max", "temperature_2m_min"],
             "timezone": "Europe/Rome", "forecast_days": 5
         }
-        response = requests.get(url, params=params, timeout=10)
+        response = await http_get_async(url, params=params)
         return response.json()
     except:
         return None
 
 
-@register_function("meteo_italia", METEO_ITALIA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
-def meteo_italia(conn, city: str):
+@register_async_function("meteo_italia", METEO_ITALIA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
+async def meteo_italia(conn, city: str):
     if not city:
         return ActionResponse(Action.REQLLM, "Specifica una città", None)
 
-    location = geocode_city(city)
+    location = await geocode_city(city)
     if not location:
         return ActionResponse(Action.REQLLM, f"Città '{city}' non trovata", None)
 
-    weather = get_weather(location["lat"], location["lon"])
+    weather = await get_weather(location["lat"], location["lon"])
     if not weather:
         return ActionResponse(Action.REQLLM, "Errore meteo, riprova", None)
 
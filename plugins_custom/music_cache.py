@@ -0,0 +1,251 @@
+"""
+Music Cache - Indice persistente della cache musicale con evizione LRU
+Due mappe: query normalizzata -> video id e video id -> file/dimensione/ultimo accesso.
+Le mappe stanno in memoria (lookup O(1)); SQLite e la rimozione dei file evitati
+sono lasciati a un thread di scrittura, così il loop non aspetta mai il disco.
+Due query che portano allo stesso video condividono lo stesso file
+"""
+
+import os
+import re
+import time
+import atexit
+import itertools
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from config.logger import setup_logging
+from plugins_func.functions.text_utils import normalize_query
+from plugins_func.functions.opus_cache import OPF_EXTENSION
+
+TAG = __name__
+logger = setup_logging()
+
+INDEX_FILENAME = "index.sqlite3"
+# Secondi tra due salvataggi degli ultimi accessi (le altre modifiche sono salvate subito)
+ACCESS_FLUSH_INTERVAL = 30
+
+
+class MusicCacheIndex:
+    """Cache musicale indicizzata: lookup in memoria, persistenza SQLite, evizione LRU"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._queries = {}  # query normalizzata -> video id
+        self._video_queries = {}  # video id -> query che portano a lui (indice inverso)
+        self._files = OrderedDict()  # video id -> {"path", "size", "title"}; ordine = LRU
+        self._lock = threading.Lock()
+        self._accessed = {}  # video id -> ultimo accesso non ancora salvato
+        self._writes = []  # (sql, parametri) in attesa del thread di scrittura
+        self._removals = []  # (video id, file) evitati da cancellare
+        self._wake = threading.Event()
+        self._db_lock = threading.Lock()  # la connessione SQLite è usata da un thread alla volta
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, INDEX_FILENAME), check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS queries (
+                query TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                video_id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                title TEXT,
+                last_access REAL NOT NULL
+            );
+            """
+        )
+        self._load()
+        threading.Thread(target=self._writer, name="music-cache", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _load(self):
+        """Carica l'indice una volta all'avvio e rimuove le voci senza file"""
+        missing = []
+        for video_id, path, size, title in self._db.execute(
+            "SELECT video_id, path, size, title FROM files ORDER BY last_access"
+        ):
+            if os.path.exists(path):
+                self._files[video_id] = {"path": path, "size": size, "title": title}
+                self.total_bytes += size
+            else:
+                missing.append((video_id,))
+        if missing:
+            self._db.executemany("DELETE FROM files WHERE video_id = ?", missing)
+
+        # Le query rimaste da video evitati o download mai completati vengono scartate
+        orphans = []
+        for query, video_id in self._db.execute("SELECT query, video_id FROM queries"):
+            if video_id in self._files:
+                self._link_query(query, video_id)
+            else:
+                orphans.append((query,))
+        self._db.executemany("DELETE FROM queries WHERE query = ?", orphans)
+        self._db.commit()
+
+        # File rimasti da versioni precedenti della cache o download interrotti. I vecchi
+        # .mp3 hanno nel nome un hash della query, non il video: non si possono migrare
+        indexed = {entry["path"] for entry in self._files.values()}
+        cache_dir = Path(self.cache_dir)
+        leftovers = itertools.chain(
+            cache_dir.glob("*.mp3"), cache_dir.glob(f"*{OPF_EXTENSION}*"), cache_dir.glob("*.src.*")
+        )
+        removed = freed = 0
+        for f in leftovers:
+            if str(f) not in indexed:
+                size = f.stat().st_size
+                f.unlink()
+                removed += 1
+                freed += size
+                logger.bind(tag=TAG).warning(f"Cache: rimosso file non indicizzato {f} ({size / 1024:.0f} KB)")
+        if removed:
+            logger.bind(tag=TAG).warning(
+                f"Cache: rimossi {removed} file non indicizzati, liberati {freed / 1024 / 1024:.1f} MB"
+            )
+
+        logger.bind(tag=TAG).info(
+            f"Indice cache musica: {len(self._files)} file, {self.total_bytes / 1024 / 1024:.1f} MB"
+        )
+
+    def path_for(self, video_id: str) -> str:
+        """Percorso in cache: pacchetti Opus pronti per il dispositivo"""
+        safe_id = re.sub(r'[^\w-]', '_', video_id)
+        return os.path.join(self.cache_dir, f"{safe_id}{OPF_EXTENSION}")
+
+    def _writer(self):
+        """Thread di scrittura: salva le modifiche in SQLite e cancella i file evitati"""
+        while True:
+            self._wake.wait(ACCESS_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"Errore salvataggio indice cache: {e}")
+
+    def flush(self):
+        """Scrive subito tutte le modifiche in sospeso (bloccante: non chiamare dal loop)"""
+        with self._db_lock:
+            with self._lock:
+                writes, self._writes = self._writes, []
+                removals, self._removals = self._removals, []
+                accessed, self._accessed = self._accessed, {}
+            for video_id, path in removals:
+                with self._lock:
+                    redownloaded = video_id in self._files
+                # Riscaricato nel frattempo: il file è di nuovo quello buono. Se il nuovo
+                # download finisce proprio ora va perso solo il file, l'indice si ripulisce
+                # al prossimo lookup_video
+                if redownloaded:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                logger.bind(tag=TAG).info(f"Cache cleanup: rimosso {path}")
+            if not writes and not accessed:
+                return
+            for sql, params in writes:
+                self._db.execute(sql, params)
+            self._db.executemany(
+                "UPDATE files SET last_access = ? WHERE video_id = ?",
+                [(access, video_id) for video_id, access in accessed.items()],
+            )
+            self._db.commit()
+
+    def _write(self, sql: str, params: tuple):
+        """Accoda una modifica dell'indice e sveglia il thread di scrittura (chiamare con lock)"""
+        self._writes.append((sql, params))
+        self._wake.set()
+
+    def _link_query(self, query: str, video_id: str):
+        """Associa query e video in entrambe le direzioni (chiamare con lock)"""
+        previous = self._queries.get(query)
+        if previous is not None and previous != video_id:
+            self._video_queries[previous].discard(query)
+            if not self._video_queries[previous]:
+                del self._video_queries[previous]
+        self._queries[query] = video_id
+        self._video_queries.setdefault(video_id, set()).add(query)
+
+    def _touch(self, video_id: str):
+        self._files.move_to_end(video_id)
+        self._accessed[video_id] = time.time()
+
+    def lookup(self, query: str) -> dict:
+        """File in cache per la query (normalizzata), o None"""
+        with self._lock:
+            video_id = self._queries.get(normalize_query(query))
+        if video_id is None:
+            return None
+        return self.lookup_video(video_id)
+
+    def lookup_video(self, video_id: str) -> dict:
+        """File in cache per il video, o None; aggiorna l'ultimo accesso"""
+        with self._lock:
+            entry = self._files.get(video_id)
+            if entry is None:
+                return None
+            if not os.path.exists(entry["path"]):
+                self._forget(video_id)
+                return None
+            self._touch(video_id)
+            logger.bind(tag=TAG).info(f"Cache hit: {entry['path']}")
+            return dict(entry, video_id=video_id)
+
+    def remember_query(self, query: str, video_id: str):
+        key = normalize_query(query)
+        if not key:
+            return
+        with self._lock:
+            self._link_query(key, video_id)
+            self._write("INSERT OR REPLACE INTO queries (query, video_id) VALUES (?, ?)", (key, video_id))
+
+    def add_file(self, video_id: str, path: str, title: str = None):
+        """Registra un file appena scaricato ed evita i meno usati se si supera il limite"""
+        size = os.path.getsize(path)
+        with self._lock:
+            old = self._files.pop(video_id, None)
+            if old:
+                self.total_bytes -= old["size"]
+            self._files[video_id] = {"path": path, "size": size, "title": title}
+            self.total_bytes += size
+            self._accessed.pop(video_id, None)
+            self._write(
+                "INSERT OR REPLACE INTO files (video_id, path, size, title, last_access) VALUES (?, ?, ?, ?, ?)",
+                (video_id, path, size, title, time.time()),
+            )
+            self._evict()
+
+    def _forget(self, video_id: str):
+        """Toglie il video e le query che portano a lui dall'indice (chiamare con lock)"""
+        entry = self._files.pop(video_id, None)
+        if entry:
+            self.total_bytes -= entry["size"]
+        self._accessed.pop(video_id, None)
+        for query in self._video_queries.pop(video_id, ()):
+            del self._queries[query]
+        self._write("DELETE FROM files WHERE video_id = ?", (video_id,))
+        self._write("DELETE FROM queries WHERE video_id = ?", (video_id,))
+        return entry
+
+    def _evict(self):
+        """Toglie i file meno usati di recente finché si torna sotto il limite; il thread di scrittura li cancella"""
+        while self.total_bytes > self.max_bytes and len(self._files) > 1:
+            video_id = next(iter(self._files))
+            entry = self._forget(video_id)
+            self._removals.append((video_id, entry["path"]))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "queries": len(self._queries),
+                "total_mb": round(self.total_bytes / 1024 / 1024, 1),
+                "max_mb": round(self.max_bytes / 1024 / 1024, 1),
+            }
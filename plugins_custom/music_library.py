@@ -0,0 +1,176 @@
+"""
+Music Library - Indice in memoria di una cartella musicale locale o NAS
+Legge i tag (mutagen se disponibile, altrimenti il nome file "Artista - Titolo"),
+costruisce un indice a trigrammi per la ricerca fuzzy di artista e titolo e si
+aggiorna in background rileggendo solo i file con mtime cambiato
+"""
+
+import os
+import time
+import threading
+from difflib import SequenceMatcher
+from config.logger import setup_logging
+from plugins_func.functions.text_utils import tokenize
+
+TAG = __name__
+logger = setup_logging()
+
+AUDIO_EXTENSIONS = {".mp3", ".flac", ".ogg", ".opus", ".m4a", ".aac", ".wav"}
+
+REINDEX_INTERVAL = 600  # Secondi tra due scansioni incrementali
+MATCH_THRESHOLD = 0.75  # Punteggio minimo per considerare trovata una canzone
+MAX_CANDIDATES = 30  # Candidati valutati con il confronto fuzzy
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def read_tags(path: str) -> tuple:
+    """(artista, titolo) dai tag del file, con ripiego sul nome file"""
+    artist, title = "", ""
+    try:
+        import mutagen
+
+        audio = mutagen.File(path, easy=True)
+        if audio is not None and audio.tags:
+            artist = (audio.tags.get("artist") or [""])[0]
+            title = (audio.tags.get("title") or [""])[0]
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.bind(tag=TAG).debug(f"Tag non leggibili {path}: {e}")
+
+    if not title:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if " - " in name:
+            artist_part, title = name.split(" - ", 1)
+            artist = artist or artist_part
+        else:
+            title = name
+    if not artist:
+        artist = os.path.basename(os.path.dirname(path))
+    return artist.strip(), title.strip()
+
+
+class LocalMusicLibrary:
+    """Indice fuzzy artista/titolo su una cartella musicale, aggiornato per mtime"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._entries = {}  # path -> {"artist", "title", "key", "mtime", "grams"}
+        self._grams = {}  # trigramma -> set di path
+        self._thread = None
+
+    def start(self):
+        """Avvia l'indicizzazione in background (prima scansione subito)"""
+        if not self.root or not os.path.isdir(self.root):
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="music-library", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.reindex()
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"Errore indicizzazione libreria: {e}")
+            time.sleep(REINDEX_INTERVAL)
+
+    def reindex(self):
+        """Scansione incrementale: rilegge solo i file nuovi o modificati"""
+        started = time.monotonic()
+        seen = set()
+        changed = 0
+        for dirpath, _dirs, files in os.walk(self.root):
+            for name in files:
+                if os.path.splitext(name)[1].lower() not in AUDIO_EXTENSIONS:
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                seen.add(path)
+                entry = self._entries.get(path)
+                if entry is not None and entry["mtime"] == mtime:
+                    continue
+                artist, title = read_tags(path)
+                self._add(path, artist, title, mtime)
+                changed += 1
+
+        removed = [path for path in list(self._entries) if path not in seen]
+        with self._lock:
+            for path in removed:
+                self._remove(path)
+
+        if changed or removed:
+            logger.bind(tag=TAG).info(
+                f"Libreria musicale: {len(self._entries)} brani "
+                f"(+{changed} -{len(removed)}) in {time.monotonic() - started:.1f}s"
+            )
+
+    def _add(self, path: str, artist: str, title: str, mtime: float):
+        key = " ".join(tokenize(f"{artist} {title}"))
+        grams = _trigrams(key)
+        with self._lock:
+            self._remove(path)
+            self._entries[path] = {"artist": artist, "title": title, "key": key, "mtime": mtime, "grams": grams}
+            for gram in grams:
+                self._grams.setdefault(gram, set()).add(path)
+
+    def _remove(self, path: str):
+        """Rimuove un brano dall'indice (chiamare con lock)"""
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return
+        for gram in entry["grams"]:
+            paths = self._grams.get(gram)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self._grams[gram]
+
+    def search(self, query: str) -> dict:
+        """Brano più simile alla query sopra MATCH_THRESHOLD, o None"""
+        query_key = " ".join(tokenize(query))
+        if not query_key:
+            return None
+        query_tokens = set(query_key.split())
+        query_sorted = " ".join(sorted(query_tokens))
+
+        with self._lock:
+            hits = {}
+            for gram in _trigrams(query_key):
+                for path in self._grams.get(gram, ()):
+                    hits[path] = hits.get(path, 0) + 1
+            candidates = sorted(hits, key=hits.get, reverse=True)[:MAX_CANDIDATES]
+            entries = [(path, self._entries[path]) for path in candidates]
+
+        best, best_score = None, 0.0
+        for path, entry in entries:
+            entry_tokens = set(entry["key"].split())
+            # Parole in comune (senza premiare query di una sola parola generica),
+            # poi somiglianza carattere per carattere su "artista titolo" (anche con
+            # le parole in ordine alfabetico, per "titolo artista") e sul solo titolo
+            token_score = len(query_tokens & entry_tokens) / max(len(query_tokens), len(entry_tokens))
+            fuzzy_score = max(
+                SequenceMatcher(None, query_key, entry["key"]).ratio(),
+                SequenceMatcher(None, query_sorted, " ".join(sorted(entry_tokens))).ratio(),
+            )
+            title_score = SequenceMatcher(None, query_key, " ".join(tokenize(entry["title"]))).ratio()
+            score = max(token_score, fuzzy_score, title_score)
+            if score > best_score:
+                best, best_score = (path, entry), score
+
+        if best is None or best_score < MATCH_THRESHOLD:
+            return None
+        path, entry = best
+        logger.bind(tag=TAG).info(f"Libreria locale: '{query}' -> {path} ({best_score:.2f})")
+        return {"path": path, "artist": entry["artist"], "title": entry["title"], "score": best_score}
+
+    def __len__(self):
+        return len(self._entries)
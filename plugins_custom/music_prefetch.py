@@ -0,0 +1,90 @@
+"""
+Music Prefetch - Budget per dispositivo dei download anticipati di cerca_musica
+Limita quanti byte un dispositivo può scaricare in anticipo per ora (banda) e
+quanti byte di brani anticipati e non ancora ascoltati può tenere in cache (disco).
+I brani in attesa valgono per la connessione: alla disconnessione non contano più
+"""
+
+import time
+import threading
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+BUDGET_WINDOW = 3600  # Finestra del budget di banda (secondi)
+PENDING_TTL = 24 * 3600  # Dopo questo tempo un brano anticipato non ascoltato non conta più
+
+
+class PrefetchBudget:
+    """Contabilità per dispositivo: byte scaricati nella finestra e brani in attesa di ascolto"""
+
+    def __init__(self, bytes_per_window: int, pending_bytes: int):
+        self.bytes_per_window = bytes_per_window
+        self.pending_bytes = pending_bytes
+        self._lock = threading.Lock()
+        self._devices = {}  # device -> {"window_start", "downloaded", "pending": {video_id: (size, t)}}
+        self._last_prune = time.monotonic()
+        self.hits = 0  # brani anticipati poi effettivamente richiesti
+
+    def _prune(self, now: float):
+        """Toglie i dispositivi con finestra scaduta e nessun brano in attesa (chiamare con lock)"""
+        if now - self._last_prune < BUDGET_WINDOW:
+            return
+        self._last_prune = now
+        for device, entry in list(self._devices.items()):
+            if now - entry["window_start"] > BUDGET_WINDOW and not entry["pending"]:
+                del self._devices[device]
+
+    def _entry(self, device: str, now: float) -> dict:
+        self._prune(now)
+        entry = self._devices.setdefault(device, {"window_start": now, "downloaded": 0, "pending": {}})
+        if now - entry["window_start"] > BUDGET_WINDOW:
+            entry["window_start"] = now
+            entry["downloaded"] = 0
+        for video_id, (_size, t) in list(entry["pending"].items()):
+            if now - t > PENDING_TTL:
+                del entry["pending"][video_id]
+        return entry
+
+    def allow(self, device: str) -> bool:
+        """True se il dispositivo ha ancora banda e spazio per un altro brano"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entry(device, now)
+            pending = sum(size for size, _t in entry["pending"].values())
+            return entry["downloaded"] < self.bytes_per_window and pending < self.pending_bytes
+
+    def record(self, device: str, video_id: str, downloaded: int, size: int):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entry(device, now)
+            entry["downloaded"] += downloaded
+            entry["pending"][video_id] = (size, now)
+
+    def consumed(self, device: str, video_id: str):
+        """Il brano anticipato è stato richiesto: non occupa più il budget disco"""
+        with self._lock:
+            entry = self._devices.get(device)
+            if entry is not None and entry["pending"].pop(video_id, None) is not None:
+                self.hits += 1
+                logger.bind(tag=TAG).info(f"Prefetch utile: {video_id} ({device})")
+
+    def disconnected(self, device: str):
+        """La connessione è chiusa: i brani anticipati non ascoltati non occupano più il budget"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._devices.get(device)
+            if entry is None:
+                return
+            entry["pending"].clear()
+            if now - entry["window_start"] > BUDGET_WINDOW:
+                del self._devices[device]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "devices": len(self._devices),
+                "pending": sum(len(e["pending"]) for e in self._devices.values()),
+                "hits": self.hits,
+            }
@@ -0,0 +1,74 @@
+"""
+News Cluster - Raggruppa le notizie quasi uguali di giornali diversi
+Ogni notizia diventa l'insieme delle radici significative di titolo e descrizione;
+una firma MinHash ne stima la somiglianza di Jaccard e il banding LSH propone solo
+le coppie probabilmente simili, così il confronto resta veloce anche con molti titoli
+"""
+
+import random
+import zlib
+from functools import lru_cache
+from plugins_func.functions.text_utils import content_terms
+
+NUM_HASHES = 64
+BANDS = 32  # Bande LSH da NUM_HASHES // BANDS righe: coppie con Jaccard ~0.3 proposte al 95%
+SIMILARITY_THRESHOLD = 0.3  # Jaccard stimato minimo per considerare due notizie la stessa storia
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # Seme fisso: firme confrontabili tra una chiamata e l'altra
+_COEFFS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+
+
+@lru_cache(maxsize=4096)
+def minhash(text: str) -> tuple:
+    """Firma MinHash delle radici del testo (tupla vuota se non ci sono parole significative)"""
+    hashes = [zlib.crc32(term.encode()) for term in set(content_terms(text))]
+    if not hashes:
+        return ()
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _COEFFS)
+
+
+def similarity(sig_a: tuple, sig_b: tuple) -> float:
+    """Jaccard stimato: frazione di componenti uguali delle due firme"""
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_HASHES
+
+
+def cluster(texts: list, threshold: float = SIMILARITY_THRESHOLD) -> list:
+    """Gruppi di indici dei testi che parlano della stessa cosa, nell'ordine del primo elemento
+
+    Ogni gruppo è guidato dalla sua prima notizia e accoglie solo quelle abbastanza simili
+    a lei: la somiglianza non è transitiva, e unire A~B e B~C metterebbe insieme due storie
+    diverse attraverso un titolo a metà strada
+    """
+    signatures = [minhash(text) for text in texts]
+
+    rows = NUM_HASHES // BANDS
+    buckets = {}
+    for i, sig in enumerate(signatures):
+        if not sig:
+            continue
+        for band in range(BANDS):
+            buckets.setdefault((band, sig[band * rows:(band + 1) * rows]), []).append(i)
+
+    # Coppie candidate dall'LSH: per ogni notizia quelle successive nello stesso bucket
+    candidates = {}
+    for members in buckets.values():
+        for pos, i in enumerate(members):
+            if pos + 1 < len(members):
+                candidates.setdefault(i, set()).update(members[pos + 1:])
+
+    leader = [None] * len(texts)
+    groups = []
+    for i in range(len(texts)):
+        if leader[i] is not None:
+            continue
+        leader[i] = i
+        group = [i]
+        for j in sorted(candidates.get(i, ())):
+            if leader[j] is None and similarity(signatures[i], signatures[j]) >= threshold:
+                leader[j] = i
+                group.append(j)
+        groups.append(group)
+    return groups
@@ -0,0 +1,114 @@
+"""
+News Index - Storico delle notizie delle ultime ore con indice invertito
+Ogni notizia vista dal poller viene indicizzata per radici italiane senza accenti
+(text_utils.content_terms) di titolo e descrizione; le notizie pubblicate prima
+della finestra (o, senza data, arrivate prima) escono dall'indice, quindi la memoria
+dipende solo dalla finestra.
+Le domande "notizie su X" vengono risolte localmente in pochi millisecondi
+"""
+
+import time
+import heapq
+import threading
+from plugins_func.functions.text_utils import content_terms
+
+WINDOW_HOURS = 72
+MAX_DOCUMENTS = 20000  # Limite di sicurezza se i feed pubblicano più del previsto
+TITLE_WEIGHT = 2  # Una parola nel titolo conta più di una nella descrizione
+# Parole della richiesta che non dicono l'argomento ("notizie su...", "cosa è successo a...")
+QUERY_NOISE = frozenset(content_terms("notizie notizia news ultime ultima novità aggiornamenti successo oggi"))
+
+
+class HeadlineIndex:
+    """Finestra mobile di notizie con indice radice -> notizie"""
+
+    def __init__(self, window: float = WINDOW_HOURS * 3600, max_documents: int = MAX_DOCUMENTS):
+        self.window = window
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._docs = {}  # id -> notizia con "title_terms"/"terms"
+        self._keys = {}  # link o titolo -> id, per non indicizzare due volte la stessa notizia
+        self._postings = {}  # radice -> set di id
+        self._expiry = []  # heap di (pubblicazione o, senza data, inserimento, id)
+        self._next_id = 0
+
+    def add(self, items: list, fonte: str, categoria: str):
+        """Indicizza le notizie di un feed; quelle già presenti vengono ignorate"""
+        now = time.time()
+        with self._lock:
+            for item in items:
+                key = item.get("link") or item["title"]
+                if key in self._keys:
+                    continue
+                published = item.get("published") or now
+                if published < now - self.window:
+                    continue
+                title_terms = set(content_terms(item["title"]))
+                terms = title_terms | set(content_terms(item["description"]))
+                if not terms:
+                    continue
+                doc_id = self._next_id
+                self._next_id += 1
+                published = min(published, now)
+                self._docs[doc_id] = dict(
+                    item, fonte=fonte, categoria=categoria, key=key, time=published,
+                    title_terms=title_terms, terms=terms,
+                )
+                self._keys[key] = doc_id
+                for term in terms:
+                    self._postings.setdefault(term, set()).add(doc_id)
+                heapq.heappush(self._expiry, (published, doc_id))
+            self._expire(now)
+
+    def _expire(self, now: float):
+        # Per data di pubblicazione: una notizia di due giorni fa letta solo ora scade tra un giorno
+        while self._expiry and (
+            self._expiry[0][0] < now - self.window or len(self._expiry) > self.max_documents
+        ):
+            _published, doc_id = heapq.heappop(self._expiry)
+            doc = self._docs.pop(doc_id)
+            self._keys.pop(doc["key"], None)
+            for term in doc["terms"]:
+                posting = self._postings.get(term)
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[term]
+
+    def search(self, query: str, limit: int = 10, hours: float = None) -> list:
+        """
+        Notizie che contengono tutte le parole della query (o, se nessuna, la maggior
+        parte), dalle più pertinenti alle più recenti
+        """
+        terms = set(content_terms(query)) - QUERY_NOISE
+        if not terms:
+            return []
+        now = time.time()
+        since = now - (hours * 3600 if hours else self.window)
+        with self._lock:
+            self._expire(now)
+            postings = sorted((self._postings.get(term, set()) for term in terms), key=len)
+            # Tutte le parole se possibile (intersezione partendo dalla lista più corta)...
+            matches = {doc_id: len(terms) for doc_id in postings[0].intersection(*postings[1:])}
+            if not matches:
+                # ...altrimenti almeno metà
+                for posting in postings:
+                    for doc_id in posting:
+                        matches[doc_id] = matches.get(doc_id, 0) + 1
+                required = (len(terms) + 1) // 2
+                matches = {doc_id: n for doc_id, n in matches.items() if n >= required}
+            scored = []
+            for doc_id, matched in matches.items():
+                doc = self._docs[doc_id]
+                if doc["time"] < since:
+                    continue
+                score = matched + TITLE_WEIGHT * len(terms & doc["title_terms"])
+                scored.append((score, doc["time"], doc))
+        best = heapq.nlargest(limit, scored, key=lambda entry: entry[:2])
+        return [
+            {k: doc[k] for k in ("title", "description", "link", "fonte", "categoria", "time")}
+            for _score, _time, doc in best
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._docs), "terms": len(self._postings)}
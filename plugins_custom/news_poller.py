@@ -0,0 +1,156 @@
+"""
+News Poller - Aggiornamento in background dei feed RSS di notizie_italia
+Un thread rilegge periodicamente tutti i feed con GET condizionale (ETag e
+If-Modified-Since: se il feed non è cambiato il server risponde 304 senza corpo)
+e tiene in memoria le notizie già analizzate. Le richieste degli utenti vengono
+servite dalla memoria senza toccare la rete
+"""
+
+import re
+import time
+import threading
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from config.logger import setup_logging
+from plugins_func.functions.http_client import http_get
+from plugins_func.functions.single_flight import SingleFlight
+
+TAG = __name__
+logger = setup_logging()
+
+POLL_INTERVAL = 300  # Secondi tra due giri su tutti i feed
+POLL_WORKERS = 6  # Feed scaricati in parallelo durante un giro
+MAX_ITEMS_PER_FEED = 50
+DESCRIPTION_CHARS = 300  # Descrizione tenuta in memoria (la risposta ne usa meno)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def _clean(text: str) -> str:
+    return _SPACE_RE.sub(" ", _TAG_RE.sub("", text or "")).strip()
+
+
+def _published(text: str):
+    """pubDate RSS (RFC 822) in timestamp, o None"""
+    if not text:
+        return None
+    try:
+        return parsedate_to_datetime(text.strip()).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_feed(content: bytes) -> list:
+    """Notizie di un feed RSS: titolo, descrizione senza HTML, link e data"""
+    root = ET.fromstring(content)
+    items = []
+    for item in root.findall(".//item")[:MAX_ITEMS_PER_FEED]:
+        title = _clean(item.findtext("title"))
+        if not title:
+            continue
+        items.append({
+            "title": title,
+            "description": _clean(item.findtext("description"))[:DESCRIPTION_CHARS],
+            "link": (item.findtext("link") or "").strip(),
+            "published": _published(item.findtext("pubDate")),
+        })
+    return items
+
+
+class NewsPoller:
+    """Feed RSS tenuti aggiornati in background, con notizie pronte in memoria"""
+
+    def __init__(self, urls: list, interval: int = POLL_INTERVAL):
+        self.urls = list(urls)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._feeds = {}  # url -> {"items", "etag", "last_modified", "checked", "changed"}
+        self._flights = SingleFlight("rss")
+        self._pool = ThreadPoolExecutor(max_workers=POLL_WORKERS, thread_name_prefix="rss")
+        self._thread = None
+        self.listeners = []  # listener(url, notizie), chiamati quando un feed cambia
+        self.stats_counts = {"fetched": 0, "not_modified": 0, "errors": 0}
+
+    def start(self):
+        """Avvia il thread di aggiornamento (primo giro subito)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="news-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                list(self._pool.map(self.poll, self.urls))
+            except RuntimeError:
+                return  # Pool chiuso: l'interprete sta terminando
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"Errore aggiornamento feed: {e}")
+            logger.bind(tag=TAG).debug(f"Feed aggiornati in {time.monotonic() - started:.1f}s: {self.stats()}")
+            time.sleep(self.interval)
+
+    def poll(self, url: str) -> list:
+        """Aggiorna un feed (una sola richiesta alla volta per URL); restituisce le notizie"""
+        return self._flights.do(url, self._poll, url)
+
+    def _poll(self, url: str) -> list:
+        with self._lock:
+            feed = self._feeds.get(url)
+        headers = dict(HEADERS)
+        if feed is not None:
+            if feed["etag"]:
+                headers["If-None-Match"] = feed["etag"]
+            if feed["last_modified"]:
+                headers["If-Modified-Since"] = feed["last_modified"]
+
+        try:
+            response = http_get(url, headers=headers)
+            if response.status_code == 304 and feed is not None:
+                with self._lock:
+                    feed["checked"] = time.time()
+                    self.stats_counts["not_modified"] += 1
+                return feed["items"]
+            response.raise_for_status()
+            items = parse_feed(response.content)
+        except Exception as e:
+            with self._lock:
+                self.stats_counts["errors"] += 1
+            logger.bind(tag=TAG).warning(f"Errore fetch RSS {url}: {e}")
+            return feed["items"] if feed is not None else []
+
+        now = time.time()
+        with self._lock:
+            self._feeds[url] = {
+                "items": items,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "checked": now,
+                "changed": now,
+            }
+            self.stats_counts["fetched"] += 1
+        for listener in self.listeners:
+            try:
+                listener(url, items)
+            except Exception as e:
+                logger.bind(tag=TAG).error(f"Errore listener feed {url}: {e}")
+        return items
+
+    def get(self, url: str):
+        """Notizie in memoria per il feed, o None se non è ancora stato letto"""
+        with self._lock:
+            feed = self._feeds.get(url)
+            return feed["items"] if feed is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self.stats_counts,
+                feeds=len(self._feeds),
+                items=sum(len(feed["items"]) for feed in self._feeds.values()),
+            )
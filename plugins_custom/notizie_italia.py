@@ -1,11 +1,17 @@
 """
 Notizie Italia Plugin - RSS feed dai principali giornali italiani
+I feed sono aggiornati in background (news_poller): le richieste leggono dalla memoria.
+Con fonte "tutte" unisce i giornali e raggruppa le notizie uguali (news_cluster);
+con argomento cerca nello storico delle ultime 72 ore (news_index)
 """
 
-import requests
-import xml.etree.ElementTree as ET
+import asyncio
 from config.logger import setup_logging
-from plugins_func.register import register_function, ToolType, ActionResponse, Action
+from plugins_func.register import ToolType, ActionResponse, Action
+from plugins_func.functions.async_plugins import register_async_function
+from plugins_func.functions.news_poller import NewsPoller
+from plugins_func.functions.news_cluster import cluster
+from plugins_func.functions.news_index import HeadlineIndex, WINDOW_HOURS
 
 TAG = __name__
 logger = setup_logging()
@@ -18,7 +24,11 @@ NOTIZIE_FUNCTION_DESC = {
             "获取意大利新闻 / Ottieni le ultime notizie dall'Italia. "
             "当用户询问新闻、头条、意大利发生了什么时使用。"
             "Use when user asks: 'notizie', 'news', 'cosa è successo', 'ultime notizie', "
-            "'headlines', 'giornale', 'ansa', 'repubblica'"
+            "'headlines', 'giornale', 'ansa', 'repubblica'. "
+            "Per una panoramica ('cosa è successo oggi') usa fonte 'tutte': "
+            "una sola chiamata legge tutti i giornali senza notizie ripetute. "
+            "Per notizie su un tema ('ci sono notizie sulla Juventus?', 'cosa è successo a Torino') "
+            "usa argomento: risposta immediata dalle notizie degli ultimi 3 giorni"
         ),
         "parameters": {
             "type": "object",
@@ -29,7 +39,11 @@ NOTIZIE_FUNCTION_DESC = {
                 },
                 "fonte": {
                     "type": "string",
-                    "description": "Fonte: ansa, repubblica, corriere. Default: ansa",
+                    "description": "Fonte: ansa, repubblica, corriere, tutte (tutti i giornali insieme). Default: ansa",
+                },
+                "argomento": {
+                    "type": "string",
+                    "description": "Parole chiave da cercare nelle notizie degli ultimi 3 giorni (es. 'Juventus', 'Torino')",
                 },
                 "num_notizie": {
                     "type": "integer",
@@ -69,47 +83,77 @@ RSS_FEEDS = {
     },
 }
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-}
-
-
-def fetch_rss_news(url: str, num_items: int = 3) -> list:
-    """Fetch news from RSS feed"""
-    try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-
-        root = ET.fromstring(response.content)
-        items = []
-
-        # Standard RSS format
-        for item in root.findall(".//item")[:num_items]:
-            title = item.find("title")
-            description = item.find("description")
-
-            if title is not None:
-                news_item = {
-                    "title": title.text.strip() if title.text else "",
-                    "description": ""
-                }
-                if description is not None and description.text:
-                    # Clean HTML tags from description
-                    desc = description.text.strip()
-                    import re
-                    desc = re.sub(r'<[^>]+>', '', desc)
-                    news_item["description"] = desc[:150] + "..." if len(desc) > 150 else desc
-
-                items.append(news_item)
-
-        return items
-    except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore fetch RSS: {e}")
-        return []
-
-
-@register_function("notizie_italia", NOTIZIE_FUNCTION_DESC, ToolType.SYSTEM_CTL)
-def notizie_italia(conn, categoria: str = "cronaca", fonte: str = "ansa", num_notizie: int = 3):
+FONTE_NOMI = {"ansa": "ANSA", "repubblica": "Repubblica", "corriere": "Corriere della Sera"}
+AGGREGATE_SOURCES = ("tutte", "tutti", "all")
+AGGREGATE_ITEMS_PER_SOURCE = 20  # Notizie di ogni giornale considerate nel raggruppamento
+DESCRIPTION_CHARS = 150
+
+# Tutti i feed aggiornati in background con GET condizionale
+news_poller = NewsPoller(url for feeds in RSS_FEEDS.values() for url in feeds.values())
+
+# Storico delle notizie viste dal poller, per le ricerche per argomento. L'ascoltatore va
+# registrato prima di start(), altrimenti il primo giro di feed non finisce nell'indice
+FEED_SOURCES = {url: (fonte, categoria) for fonte, feeds in RSS_FEEDS.items() for categoria, url in feeds.items()}
+headline_index = HeadlineIndex()
+news_poller.listeners.append(lambda url, items: headline_index.add(items, *FEED_SOURCES.get(url, ("", ""))))
+news_poller.start()
+
+
+async def _feed_items(url: str) -> list:
+    """Notizie del feed dalla memoria; se non è ancora stato letto lo scarica ora"""
+    items = news_poller.get(url)
+    if items is None:
+        loop = asyncio.get_running_loop()
+        items = await loop.run_in_executor(None, news_poller.poll, url)
+    return items
+
+
+def _short(item: dict) -> dict:
+    desc = item["description"]
+    return {
+        "title": item["title"],
+        "description": desc[:DESCRIPTION_CHARS] + "..." if len(desc) > DESCRIPTION_CHARS else desc,
+    }
+
+
+async def fetch_rss_news(url: str, num_items: int = 3) -> list:
+    """Prime notizie di un feed"""
+    return [_short(item) for item in (await _feed_items(url))[:num_items]]
+
+
+async def aggregate_news(categoria: str, num_items: int = 3) -> list:
+    """
+    Notizie della categoria da tutti i giornali: una per storia, con i giornali che la
+    riportano; prima le storie riprese da più fonti, poi quelle più in alto nei feed
+    """
+    fonti = [fonte for fonte, feeds in RSS_FEEDS.items() if categoria in feeds]
+    feeds = await asyncio.gather(*(_feed_items(RSS_FEEDS[fonte][categoria]) for fonte in fonti))
+
+    entries = []  # (fonte, posizione nel feed, notizia)
+    for fonte, items in zip(fonti, feeds):
+        for position, item in enumerate(items[:AGGREGATE_ITEMS_PER_SOURCE]):
+            entries.append((fonte, position, item))
+    groups = cluster([f"{item['title']} {item['description']}" for _fonte, _pos, item in entries])
+
+    stories = []
+    for group in groups:
+        members = [entries[i] for i in group]
+        sources = list(dict.fromkeys(fonte for fonte, _pos, _item in members))
+        # La versione con la descrizione più completa rappresenta la storia
+        representative = max(members, key=lambda entry: len(entry[2]["description"]))[2]
+        best_position = min(position for _fonte, position, _item in members)
+        stories.append((-len(sources), best_position, sources, representative))
+    stories.sort(key=lambda story: story[:2])
+
+    return [
+        dict(_short(item), fonti=[FONTE_NOMI.get(fonte, fonte) for fonte in sources])
+        for _n, _pos, sources, item in stories[:num_items]
+    ]
+
+
+@register_async_function("notizie_italia", NOTIZIE_FUNCTION_DESC, ToolType.SYSTEM_CTL)
+async def notizie_italia(conn, categoria: str = "cronaca", fonte: str = "ansa", num_notizie: int = 3,
+                         argomento: str = None):
     """Ottieni le ultime notizie dall'Italia"""
 
     # Normalizza input
@@ -117,6 +161,11 @@ def notizie_italia(conn, categoria: str = "cronaca", fonte: str = "ansa", num_no
     fonte = fonte.lower() if fonte else "ansa"
     num_notizie = min(max(1, num_notizie if num_notizie else 3), 5)
 
+    if argomento and argomento.strip():
+        return notizie_argomento(argomento.strip(), num_notizie)
+    if fonte in AGGREGATE_SOURCES:
+        return await notizie_aggregate(categoria, num_notizie)
+
     # Valida fonte e categoria
     if fonte not in RSS_FEEDS:
         fonte = "ansa"
@@ -126,7 +175,7 @@ def notizie_italia(conn, categoria: str = "cronaca", fonte: str = "ansa", num_no
     url = RSS_FEEDS[fonte][categoria]
     logger.bind(tag=TAG).info(f"Fetching news: {fonte}/{categoria}")
 
-    news = fetch_rss_news(url, num_notizie)
+    news = await fetch_rss_news(url, num_notizie)
 
     if not news:
         return ActionResponse(
@@ -135,8 +184,7 @@ def notizie_italia(conn, categoria: str = "cronaca", fonte: str = "ansa", num_no
             None
         )
 
-    fonte_nome = {"ansa": "ANSA", "repubblica": "Repubblica", "corriere": "Corriere della Sera"}
-    result = f"📰 **Ultime notizie {categoria.upper()}** da {fonte_nome.get(fonte, fonte)}:\n\n"
+    result = f"📰 **Ultime notizie {categoria.upper()}** da {FONTE_NOMI.get(fonte, fonte)}:\n\n"
 
     for i, item in enumerate(news, 1):
         result += f"{i}. **{item['title']}**\n"
@@ -145,3 +193,56 @@ def notizie_italia(conn, categoria: str = "cronaca", fonte: str = "ansa", num_no
         result += "\n"
 
     return ActionResponse(Action.REQLLM, result, None)
+
+
+async def notizie_aggregate(categoria: str, num_notizie: int):
+    """Panoramica da tutti i giornali, senza ripetere la stessa storia"""
+    if not any(categoria in feeds for feeds in RSS_FEEDS.values()):
+        categoria = "cronaca"
+    logger.bind(tag=TAG).info(f"Fetching news: tutte/{categoria}")
+
+    news = await aggregate_news(categoria, num_notizie)
+    if not news:
+        return ActionResponse(
+            Action.REQLLM,
+            "Non sono riuscito a recuperare le notizie. Riprova più tardi.",
+            None
+        )
+
+    result = f"📰 **Ultime notizie {categoria.upper()}** dai principali giornali:\n\n"
+    for i, item in enumerate(news, 1):
+        result += f"{i}. **{item['title']}** ({', '.join(item['fonti'])})\n"
+        if item['description']:
+            result += f"   {item['description']}\n"
+        result += "\n"
+
+    return ActionResponse(Action.REQLLM, result, None)
+
+
+def notizie_argomento(argomento: str, num_notizie: int):
+    """Notizie su un tema dallo storico locale, una per storia"""
+    logger.bind(tag=TAG).info(f"Ricerca notizie: '{argomento}'")
+    found = headline_index.search(argomento, limit=num_notizie * 4)
+
+    # Stessa storia da più giornali: una sola voce con tutte le fonti
+    stories = []
+    for group in cluster([f"{item['title']} {item['description']}" for item in found]):
+        sources = list(dict.fromkeys(FONTE_NOMI.get(found[i]["fonte"], found[i]["fonte"]) for i in group))
+        stories.append(dict(_short(found[group[0]]), fonti=sources))
+
+    if not stories:
+        return ActionResponse(
+            Action.REQLLM,
+            f"Nessuna notizia su '{argomento}' nelle ultime {WINDOW_HOURS} ore. "
+            "Puoi provare una ricerca web.",
+            None
+        )
+
+    result = f"📰 **Notizie su {argomento}** (ultime {WINDOW_HOURS} ore):\n\n"
+    for i, item in enumerate(stories[:num_notizie], 1):
+        result += f"{i}. **{item['title']}** ({', '.join(item['fonti'])})\n"
+        if item['description']:
+            result += f"   {item['description']}\n"
+        result += "\n"
+
+    return ActionResponse(Action.REQLLM, result, None)
@@ -0,0 +1,192 @@
+"""
+Opus Cache - Formato di cache per audio già pronto per il dispositivo
+File .opf: intestazione fissa seguita da pacchetti Opus con prefisso di lunghezza,
+allo stesso sample rate e durata frame usati verso il dispositivo.
+La riproduzione legge i pacchetti via mmap e li invia senza decodifica né ricodifica,
+al ritmo dell'ascolto; la scrittura avviene in un thread dedicato, fuori dalla loop
+"""
+
+import os
+import mmap
+import time
+import struct
+import asyncio
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from config.logger import setup_logging
+from plugins_func.functions.audio_stream import (
+    SAMPLE_RATE, CHANNELS, FRAME_DURATION_MS, FRAME_BYTES, PACKETS_PER_PUSH,
+    OpusFrameEncoder, ffmpeg_pcm_output_args, kill_process, push_opus_packets, is_connection_closed
+)
+from plugins_func.functions.media_supervisor import supervisor
+
+TAG = __name__
+logger = setup_logging()
+
+OPF_EXTENSION = ".opf"
+OPF_MAGIC = b"XZOPF1\x00\x00"
+# magic, sample rate, durata frame (ms), canali
+_HEADER = struct.Struct("<8sIHH")
+_LENGTH = struct.Struct("<H")
+# Audio messo in coda in anticipo sul tempo reale: assorbe i ritardi del loop
+PLAYBACK_LEAD_MS = 2000
+
+# Un solo thread per tutte le scritture: le operazioni di ogni file restano in ordine
+_write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="opf")
+
+
+class OpusFrameWriter:
+    """
+    Scrive pacchetti Opus su <path>.part e lo rinomina solo a scrittura completa.
+    write() e abort() non bloccano: il lavoro su disco è accodato al thread di scrittura
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.part_path = path + ".part"
+        self.packets = 0
+        self._file = None
+        self._error = None
+        self._submit(self._open)
+
+    def _submit(self, func, *args):
+        _write_pool.submit(self._guarded, func, *args)
+
+    def _guarded(self, func, *args):
+        if self._error is not None:
+            return
+        try:
+            func(*args)
+        except OSError as e:
+            self._error = e
+            logger.bind(tag=TAG).error(f"Errore scrittura {self.part_path}: {e}")
+
+    def _open(self):
+        self._file = open(self.part_path, "wb")
+        self._file.write(_HEADER.pack(OPF_MAGIC, SAMPLE_RATE, FRAME_DURATION_MS, CHANNELS))
+
+    def write(self, packets: list):
+        if not packets:
+            return
+        data = b"".join(_LENGTH.pack(len(packet)) + packet for packet in packets)
+        self.packets += len(packets)
+        self._submit(self._file_write, data)
+
+    def _file_write(self, data: bytes):
+        self._file.write(data)
+
+    def _commit(self) -> bool:
+        if self._error is not None or self.packets == 0:
+            self._abort()
+            return False
+        self._file.close()
+        os.replace(self.part_path, self.path)
+        return True
+
+    async def commit(self) -> bool:
+        """Attende le scritture in sospeso e pubblica il file; False se vuoto o non scritto"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_write_pool, self._commit)
+        except OSError as e:
+            logger.bind(tag=TAG).error(f"Errore salvataggio {self.path}: {e}")
+            self.abort()
+            return False
+
+    def _abort(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+    def abort(self):
+        """Scarta il file parziale (dopo le scritture già accodate)"""
+        _write_pool.submit(self._abort)
+
+
+def iter_opus_frames(path: str):
+    """
+    Pacchetti di un file .opf letti man mano tramite mmap, ognuno copiato in bytes
+    (i pacchetti in coda non dipendono dalla mappa). La mappa si chiude quando il
+    generatore finisce o viene chiuso; un file troncato si ferma all'ultimo pacchetto intero
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            data.madvise(mmap.MADV_SEQUENTIAL)  # read-ahead: niente attese sul disco a metà brano
+        magic, sample_rate, frame_ms, channels = _HEADER.unpack_from(data, 0)
+        if magic != OPF_MAGIC:
+            raise ValueError(f"File opf non valido: {path}")
+        if (sample_rate, frame_ms, channels) != (SAMPLE_RATE, FRAME_DURATION_MS, CHANNELS):
+            raise ValueError(f"Formato opf non compatibile: {sample_rate}Hz {frame_ms}ms {channels}ch")
+
+        offset = _HEADER.size
+        end = len(data)
+        while offset < end:
+            if offset + _LENGTH.size > end:
+                logger.bind(tag=TAG).warning(f"File opf troncato: {path}")
+                return
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            if offset + length > end:
+                logger.bind(tag=TAG).warning(f"File opf troncato: {path}")
+                return
+            yield data[offset:offset + length]
+            offset += length
+
+
+def is_opus_cache_file(path: str) -> bool:
+    return path.endswith(OPF_EXTENSION)
+
+
+async def play_opus_file(conn, path: str) -> int:
+    """
+    Invia un file .opf alla coda audio a blocchi al ritmo della riproduzione (con
+    PLAYBACK_LEAD_MS di anticipo); restituisce i pacchetti inviati
+    """
+    frames = iter_opus_frames(path)
+    started = time.monotonic()
+    sent = 0
+    try:
+        while not is_connection_closed(conn):
+            packets = list(islice(frames, PACKETS_PER_PUSH))
+            if not packets:
+                break
+            push_opus_packets(conn, packets)
+            sent += len(packets)
+            delay = (sent * FRAME_DURATION_MS - PLAYBACK_LEAD_MS) / 1000 - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+    finally:
+        frames.close()  # chiude subito la mappa anche con stop o disconnessione
+    return sent
+
+
+async def transcode_to_opus_file(source: str, path: str, kind: str = "music") -> bool:
+    """Converte un file audio locale in .opf (ffmpeg supervisionato -> PCM -> Opus)"""
+    process = None
+    writer = OpusFrameWriter(path)
+    encoder = OpusFrameEncoder()
+    try:
+        process = await supervisor.spawn(
+            kind,
+            ["ffmpeg", "-loglevel", "error", "-i", source, *ffmpeg_pcm_output_args()],
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        while True:
+            pcm = await process.stdout.read(FRAME_BYTES * PACKETS_PER_PUSH)
+            if not pcm:
+                break
+            writer.write(encoder.encode(pcm))
+        writer.write(encoder.flush())
+        await process.wait()
+        if process.returncode != 0:
+            writer.abort()
+            return False
+        return await writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        await kill_process(process)
@@ -0,0 +1,217 @@
+"""
+Page Extractor - Estrazione del testo principale da pagine HTML in un solo passaggio
+Rimuove il contorno (menu, script, footer...) e individua main/article/div.content.
+Con html.parser della libreria standard l'analisi procede mentre il documento viene
+letto; con selectolax (parser C, usato se installato) l'HTML viene accumulato e
+analizzato una volta sola alla fine
+"""
+
+import re
+from html.parser import HTMLParser
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as LexborParser
+except ImportError:
+    LexborParser = None
+
+# Elementi il cui testo non è contenuto utile
+SKIP_TAGS = {
+    "title", "script", "style", "nav", "footer", "header", "aside",
+    "iframe", "noscript", "form", "svg", "template",
+}
+# Elementi che contengono il contenuto principale (main, article e questi div)
+MAIN_CLASS_RE = re.compile(r'content|article|post|entry')
+# Elementi di blocco: il loro inizio e la loro fine separano le parole
+BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "dl", "dt", "dd", "h1", "h2", "h3", "h4", "h5", "h6",
+    "table", "tr", "td", "th", "section", "article", "main", "blockquote", "pre", "figcaption", "hr",
+}
+# Elementi senza tag di chiusura (non vanno contati nella profondità)
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# Sotto questa lunghezza il contenuto principale trovato non è affidabile
+MIN_MAIN_CHARS = 200
+# Senza contenuto principale riconoscibile serve più margine prima di fermarsi
+OTHER_TEXT_FACTOR = 4
+# Con selectolax: markup minimo letto prima di fermarsi alla chiusura di article/main
+# (evita di fermarsi su un box "articoli correlati" in cima alla pagina)
+LEXBOR_MIN_MARKUP = 256 * 1024
+
+_SPACES_RE = re.compile(r'\s+')
+_MAIN_END_RE = re.compile(r'</(?:article|main)\s*>', re.IGNORECASE)
+# Caratteri del blocco precedente riletti insieme al successivo: un tag di chiusura
+# spezzato tra due blocchi viene comunque trovato
+_MAIN_END_TAIL = 32
+# In ordine di priorità: un div contenitore che viene prima nel documento non deve battere main/article
+_MAIN_SELECTORS = (
+    "main", "article", "div[class*=content]", "div[class*=article]", "div[class*=post]", "div[class*=entry]",
+)
+
+
+class _Candidate:
+    """Un elemento main/article/div.content con il testo raccolto al suo interno"""
+
+    __slots__ = ("priority", "parts", "chars")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.parts = []
+        self.chars = 0
+
+
+class StreamingTextExtractor(HTMLParser):
+    """
+    Estrae il testo mentre i byte arrivano: salta gli elementi di contorno, tiene
+    da parte il testo di ogni main/article/div.content e segnala quando ne ha
+    raccolto abbastanza per fermare il download. Sceglie l'elemento come
+    LexborTextExtractor: prima main, poi article, poi i div, il primo abbastanza lungo
+    """
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.all_parts = []  # tutto il testo non di contorno, per le pagine senza contenuto riconoscibile
+        self.main_chars = 0  # testo del candidato più lungo
+        self.total_chars = 0
+        self._candidates = []
+        self._open = []  # candidati aperti, dal più esterno
+        self._stack = []  # tag aperti con (skip, candidato o None)
+        self._skip_depth = 0
+
+    def _targets(self):
+        return [self.all_parts] + [candidate.parts for candidate in self._open]
+
+    def _separate(self):
+        # I frammenti di testo sono tenuti così come arrivano: HTMLParser spezza il
+        # testo a ogni feed(), quindi lo spazio tra le parole viene solo dai blocchi
+        if self._skip_depth:
+            return
+        for parts in self._targets():
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+
+    def _priority(self, tag, attrs):
+        if tag == "main":
+            return 0
+        if tag == "article":
+            return 1
+        if tag == "div" and MAIN_CLASS_RE.search(dict(attrs).get("class") or ""):
+            return 2
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._separate()
+        if tag in VOID_TAGS:
+            return
+        skip = tag in SKIP_TAGS
+        candidate = None
+        if not self._skip_depth and not skip:
+            priority = self._priority(tag, attrs)
+            if priority is not None:
+                candidate = _Candidate(priority)
+                self._candidates.append(candidate)
+                self._open.append(candidate)
+        self._stack.append((tag, skip, candidate))
+        self._skip_depth += skip
+
+    def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS:
+            self._separate()
+        # Chiude fino al tag corrispondente (HTML reale ha tag non chiusi)
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                for _tag, skip, candidate in self._stack[i:]:
+                    self._skip_depth -= skip
+                    if candidate is not None:
+                        self._open.remove(candidate)
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        # Spazi e a capo dell'indentazione non contano per i limiti
+        chars = len(data.strip())
+        self.all_parts.append(data)
+        self.total_chars += chars
+        for candidate in self._open:
+            candidate.parts.append(data)
+            candidate.chars += chars
+            if candidate.chars > self.main_chars:
+                self.main_chars = candidate.chars
+
+    @property
+    def enough(self) -> bool:
+        return self.main_chars >= self.max_chars or self.total_chars >= self.max_chars * OTHER_TEXT_FACTOR
+
+    def text(self) -> str:
+        parts = self.all_parts
+        for priority in range(3):
+            found = next((c for c in self._candidates if c.priority == priority and c.chars >= MIN_MAIN_CHARS), None)
+            if found is not None:
+                parts = found.parts
+                break
+        return _SPACES_RE.sub(' ', ''.join(parts)).strip()
+
+
+class LexborTextExtractor:
+    """
+    Stessa interfaccia di StreamingTextExtractor con il parser C di selectolax, ma
+    non incrementale: accumula l'HTML e lo analizza una volta sola in text().
+    Il download si ferma presto solo se compare la chiusura di article/main dopo
+    LEXBOR_MIN_MARKUP caratteri; una pagina senza quel tag viene letta fino al
+    limite di byte di chi scarica
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._chunks = []
+        self._size = 0
+        self._main_closed = False
+        self._tail = ""
+
+    def feed(self, data: str):
+        self._chunks.append(data)
+        self._size += len(data)
+        if not self._main_closed:
+            scan = self._tail + data
+            self._main_closed = _MAIN_END_RE.search(scan) is not None
+            self._tail = scan[-_MAIN_END_TAIL:]
+
+    def close(self):
+        pass
+
+    @property
+    def enough(self) -> bool:
+        return self._main_closed and self._size >= LEXBOR_MIN_MARKUP
+
+    def text(self) -> str:
+        tree = LexborParser("".join(self._chunks))
+        tree.strip_tags(list(SKIP_TAGS))
+        text = ""
+        for selector in _MAIN_SELECTORS:
+            for node in tree.css(selector):
+                text = node.text(separator=" ", strip=True)
+                if len(text) >= MIN_MAIN_CHARS:
+                    break
+            if len(text) >= MIN_MAIN_CHARS:
+                break
+        if len(text) < MIN_MAIN_CHARS:
+            body = tree.body or tree.root
+            text = body.text(separator=" ", strip=True) if body is not None else ""
+        return _SPACES_RE.sub(' ', text).strip()
+
+
+def make_extractor(max_chars: int):
+    """Estrattore incrementale migliore disponibile"""
+    if LexborParser is not None:
+        return LexborTextExtractor(max_chars)
+    return StreamingTextExtractor(max_chars)
+
+
+def extract_text(html: str, max_chars: int = 4000, extractor_class=None) -> str:
+    """Testo principale di un documento già scaricato"""
+    extractor = extractor_class(max_chars) if extractor_class else make_extractor(max_chars)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
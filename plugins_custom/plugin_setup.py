@@ -0,0 +1,75 @@
+"""
+Plugin Setup - Avvio dei servizi condivisi dai plugin
+Il server importa tutti i moduli di plugins_func/functions: questo è l'unico punto che
+avvia thread di processo. Gli altri moduli si limitano a definire oggetti e non hanno
+effetti all'import (a parte il poller delle notizie).
+Qui parte il log periodico delle metriche: ogni STATS_LOG_INTERVAL secondi una sola
+riga di debug con gli stats() di tutti i plugin caricati
+"""
+
+import sys
+import time
+import threading
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+STATS_LOG_INTERVAL = 600  # Secondi tra due righe di log con le metriche
+
+PACKAGE = "plugins_func.functions"
+
+# nome nel log -> (modulo, funzione o oggetto.metodo che restituisce il dizionario)
+STATS_SOURCES = {
+    "http": ("http_client", "http_stats"),
+    "media_supervisor": ("media_supervisor", "supervisor.stats"),
+    "media_tasks": ("media_tasks", "media_stats"),
+    "music_cache": ("cerca_musica", "music_cache.stats"),
+    "music_prefetch": ("cerca_musica", "prefetch_budget.stats"),
+    "news_poller": ("notizie_italia", "news_poller.stats"),
+    "news_index": ("notizie_italia", "headline_index.stats"),
+    "search_backends": ("web_search", "search_backend.stats"),
+    "search_cache": ("web_search", "search_cache.stats"),
+    "session_search_results": ("web_search", "search_results.stats"),
+    "session_pages": ("leggi_pagina", "prefetched_pages.stats"),
+}
+
+
+def collect_stats() -> dict:
+    """Metriche dei plugin già importati dal server; quelli non caricati vengono saltati"""
+    collected = {}
+    for name, (module_name, path) in STATS_SOURCES.items():
+        target = sys.modules.get(f"{PACKAGE}.{module_name}")
+        if target is None:
+            continue
+        try:
+            for attr in path.split("."):
+                target = getattr(target, attr)
+            collected[name] = target()
+        except Exception as e:
+            collected[name] = f"errore: {e}"
+    return collected
+
+
+def _log_stats():
+    last = None
+    while True:
+        time.sleep(STATS_LOG_INTERVAL)
+        stats = collect_stats()
+        if stats != last:  # Niente righe uguali quando i plugin sono fermi
+            logger.bind(tag=TAG).debug(f"Metriche plugin: {stats}")
+            last = stats
+
+
+_stats_thread = None
+
+
+def init():
+    """Avvia il log periodico delle metriche (una volta sola)"""
+    global _stats_thread
+    if _stats_thread is None:
+        _stats_thread = threading.Thread(target=_log_stats, name="plugin-stats", daemon=True)
+        _stats_thread.start()
+
+
+init()
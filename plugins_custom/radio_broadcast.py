@@ -0,0 +1,114 @@
+"""
+Radio Broadcast - Una sola cattura ffmpeg per stazione condivisa tra tutti gli ascoltatori
+I pacchetti Opus vengono codificati una volta e distribuiti a ogni connessione
+iscritta; la cattura si chiude quando esce l'ultimo ascoltatore
+"""
+
+import asyncio
+from collections import deque
+from config.logger import setup_logging
+from plugins_func.functions.audio_stream import (
+    open_pcm_process, kill_process, OpusFrameEncoder, FRAME_BYTES, FRAME_DURATION_MS, PACKETS_PER_PUSH
+)
+from plugins_func.functions.media_supervisor import SupervisorBusy
+
+TAG = __name__
+logger = setup_logging()
+
+# Secondi di audio tenuti in memoria per far partire subito i nuovi ascoltatori
+RING_SECONDS = 3
+RING_PACKETS = RING_SECONDS * 1000 // FRAME_DURATION_MS
+
+# Blocchi in attesa per ascoltatore (~6s): oltre si scartano i più vecchi
+LISTENER_QUEUE_SIZE = 20
+
+# Catture attive: station key -> StationBroadcast
+broadcasts = {}
+
+
+class StationBroadcast:
+    """Cattura condivisa di una stazione con ring buffer di pacchetti Opus"""
+
+    def __init__(self, key: str, url: str):
+        self.key = key
+        self.url = url
+        self.listeners = set()
+        self.ring = deque(maxlen=RING_PACKETS)
+        self.process = None
+        self.task = None
+        self.busy = False  # True se il supervisore non ha ammesso la cattura
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        logger.bind(tag=TAG).info(f"Cattura avviata: {self.key}")
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=LISTENER_QUEUE_SIZE)
+        if self.ring:
+            queue.put_nowait(list(self.ring))
+        self.listeners.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.listeners.discard(queue)
+        if not self.listeners:
+            self.close()
+
+    def close(self):
+        if broadcasts.get(self.key) is self:
+            broadcasts.pop(self.key, None)
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        logger.bind(tag=TAG).info(f"Cattura chiusa: {self.key}")
+
+    def _offer(self, queue: asyncio.Queue, item):
+        """Accoda senza bloccare: un ascoltatore lento perde l'audio più vecchio"""
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(item)
+
+    async def _run(self):
+        encoder = OpusFrameEncoder()
+        read_size = FRAME_BYTES * PACKETS_PER_PUSH
+        try:
+            self.process = await open_pcm_process(self.url, kind="radio")
+            while True:
+                pcm = await self.process.stdout.read(read_size)
+                if not pcm:
+                    break
+                packets = encoder.encode(pcm)
+                if not packets:
+                    continue
+                self.ring.extend(packets)
+                for queue in list(self.listeners):
+                    self._offer(queue, packets)
+        except SupervisorBusy as e:
+            self.busy = True
+            logger.bind(tag=TAG).warning(f"Cattura {self.key} non ammessa: {e}")
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Errore cattura {self.key}: {e}")
+        finally:
+            await kill_process(self.process)
+            # Segnala fine stream a chi è ancora in ascolto
+            for queue in list(self.listeners):
+                self._offer(queue, None)
+            if broadcasts.get(self.key) is self:
+                broadcasts.pop(self.key, None)
+
+
+def subscribe(key: str, url: str):
+    """Iscrive una connessione alla stazione, avviando la cattura se serve"""
+    broadcast = broadcasts.get(key)
+    if broadcast is None:
+        broadcast = StationBroadcast(key, url)
+        broadcasts[key] = broadcast
+        broadcast.start()
+    return broadcast, broadcast.subscribe()
+
+
+def broadcast_stats() -> dict:
+    """Ascoltatori per stazione attualmente in cattura"""
+    return {key: len(b.listeners) for key, b in broadcasts.items()}
@@ -1,23 +1,40 @@
 """
 Radio Italia Plugin - Riproduce stazioni radio italiane in streaming
-Cattura chunk audio e li riproduce tramite il sistema TTS
+In modalità streaming ogni stazione ha una sola cattura ffmpeg condivisa
+(radio_broadcast) e i frame vengono inviati subito a tutti i dispositivi in
+ascolto finché l'utente non dice stop.
+In alternativa cattura segmenti audio a rotazione e li riproduce uno dopo
+l'altro tramite il sistema TTS, sempre fino allo stop
 """
 
 import os
-import subprocess
+import shutil
 import asyncio
+import tempfile
 from config.logger import setup_logging
-from plugins_func.register import register_function, ToolType, ActionResponse, Action
+from plugins_func.register import ToolType, ActionResponse, Action
+from plugins_func.functions.async_plugins import register_async_function
 from core.handle.sendAudioHandle import send_stt_message
 from core.utils.dialogue import Message
 from core.providers.tts.dto.dto import TTSMessageDTO, SentenceType, ContentType
+from plugins_func.functions.audio_stream import (
+    kill_process, start_playback, end_playback, push_opus_packets, is_connection_closed, USER_AGENT
+)
+from plugins_func.functions.radio_broadcast import subscribe
+from plugins_func.functions.media_tasks import track_task, track_process, untrack_process, cancel_media
+from plugins_func.functions.radio_prober import ensure_prober_started, resolved_url, is_station_down
+from plugins_func.functions.media_supervisor import supervisor, SupervisorBusy
 
 TAG = __name__
 logger = setup_logging()
 
 # Directory cache radio
 RADIO_CACHE_DIR = "/tmp/xiaozhi_radio"
-CHUNK_DURATION = 60  # Secondi per chunk
+SEGMENT_DURATION = 20  # Secondi per segmento
+SEGMENT_SLOTS = 4  # File riusati a rotazione per sessione (disco costante)
+
+# Streaming live (True) oppure cattura a segmenti da SEGMENT_DURATION secondi (False)
+RADIO_STREAMING = True
 
 # Stazioni radio italiane con stream URL
 RADIO_STATIONS = {
@@ -160,55 +177,25 @@ def find_station(query: str) -> dict:
     return None
 
 
-def capture_radio_chunk(url: str, output_path: str, duration: int = 60) -> bool:
-    """Cattura un chunk di radio usando ffmpeg"""
-    try:
-        os.makedirs(RADIO_CACHE_DIR, exist_ok=True)
-
-        cmd = [
-            "ffmpeg",
-            "-user_agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "-i", url,
-            "-t", str(duration),
-            "-c:a", "libmp3lame",
-            "-b:a", "128k",
-            "-y",
-            output_path
-        ]
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            timeout=duration + 30
-        )
-
-        if os.path.exists(output_path) and os.path.getsize(output_path) > 1000:
-            logger.bind(tag=TAG).info(f"Radio catturata: {output_path}")
-            return True
-
-        return False
-
-    except subprocess.TimeoutExpired:
-        logger.bind(tag=TAG).error("Timeout cattura radio")
-        return False
-    except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore cattura radio: {e}")
-        return False
-
-
-@register_function("radio_italia", RADIO_ITALIA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
-def radio_italia(conn, action: str = "list", station: str = None):
+@register_async_function("radio_italia", RADIO_ITALIA_FUNCTION_DESC, ToolType.SYSTEM_CTL)
+async def radio_italia(conn, action: str = "list", station: str = None):
     logger.bind(tag=TAG).info(f"Radio Italia: action={action}, station={station}")
 
+    # Controllo periodico delle stazioni in background
+    ensure_prober_started(conn.loop, RADIO_STATIONS)
+
     if action == "list":
         result = "📻 **Stazioni radio disponibili:**\n\n"
         for key, s in RADIO_STATIONS.items():
-            result += f"• **{s['name']}** - {s['desc']}\n"
+            offline = " (non raggiungibile)" if is_station_down(s) else ""
+            result += f"• **{s['name']}** - {s['desc']}{offline}\n"
         result += "\nDi' 'metti [nome radio]' per ascoltare!"
         return ActionResponse(Action.REQLLM, result, None)
 
     if action == "stop":
-        return ActionResponse(Action.REQLLM, "Radio fermata", None)
+        if cancel_media(conn):
+            return ActionResponse(Action.REQLLM, "Radio fermata", None)
+        return ActionResponse(Action.REQLLM, "Nessuna radio in riproduzione", None)
 
     if action == "play":
         if not station:
@@ -221,8 +208,22 @@ def radio_italia(conn, action: str = "list", station: str = None):
             return ActionResponse(Action.REQLLM,
                 f"Radio '{station}' non trovata. Prova: {stations_list}...", None)
 
-        # Avvia cattura e riproduzione in background
-        conn.loop.create_task(capture_and_play_radio(conn, found))
+        if is_station_down(found):
+            alternatives = ", ".join(
+                [s["name"] for s in RADIO_STATIONS.values() if not is_station_down(s)][:3]
+            )
+            hint = f" Prova: {alternatives}" if alternatives else " Riprova più tardi."
+            return ActionResponse(Action.REQLLM,
+                f"{found['name']} al momento non è raggiungibile.{hint}", None)
+
+        # Sostituisce radio o musica già in riproduzione
+        cancel_media(conn)
+
+        if RADIO_STREAMING:
+            track_task(conn, stream_radio(conn, found))
+        else:
+            # Avvia cattura e riproduzione in background
+            track_task(conn, capture_and_play_radio(conn, found))
 
         return ActionResponse(
             Action.REQLLM,
@@ -233,81 +234,153 @@ def radio_italia(conn, action: str = "list", station: str = None):
     return ActionResponse(Action.REQLLM, "Azione non riconosciuta", None)
 
 
-async def capture_and_play_radio(conn, station: dict):
-    """Cattura chunk radio e riproducilo"""
+async def stream_radio(conn, station: dict):
+    """Ascolta la cattura condivisa della stazione e invia i frame al dispositivo"""
+    station_name = station["name"]
+    broadcast = None
+    queue = None
+    playing = False
     try:
-        station_name = station["name"]
-        url = station["url"]
-
         await send_stt_message(conn, f"Sintonizzazione su {station_name}...")
 
-        # Nome file cache
-        safe_name = station_name.lower().replace(" ", "_").replace(".", "")
-        output_path = os.path.join(RADIO_CACHE_DIR, f"{safe_name}.mp3")
-
-        # Cattura in thread separato
-        loop = asyncio.get_event_loop()
-        success = await loop.run_in_executor(
-            None,
-            capture_radio_chunk,
-            url,
-            output_path,
-            CHUNK_DURATION
-        )
-
-        if success and os.path.exists(output_path):
-            await play_radio_chunk(conn, output_path, station_name)
-        else:
-            await send_stt_message(conn, f"Non riesco a sintonizzare {station_name}")
-
-    except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore capture_and_play_radio: {e}")
+        broadcast, queue = subscribe(station_name, resolved_url(station))
 
+        # Attendi i primi dati prima di aprire il turno audio
+        packets = await asyncio.wait_for(queue.get(), timeout=15)
+        if not packets:
+            if broadcast.busy:
+                await send_stt_message(conn, "Troppe richieste audio in corso, riprova tra poco")
+            else:
+                await send_stt_message(conn, f"Non riesco a sintonizzare {station_name}")
+            return
 
-async def play_radio_chunk(conn, audio_path: str, station_name: str):
-    """Riproduce il chunk audio della radio"""
-    try:
         text = f"Ecco {station_name}!"
         await send_stt_message(conn, text)
         conn.dialogue.put(Message(role="assistant", content=text))
+        start_playback(conn)
+        playing = True
+        logger.bind(tag=TAG).info(f"Radio in streaming: {station_name}")
 
-        if conn.intent_type == "intent_llm":
-            conn.tts.tts_text_queue.put(
-                TTSMessageDTO(
-                    sentence_id=conn.sentence_id,
-                    sentence_type=SentenceType.FIRST,
-                    content_type=ContentType.ACTION,
-                )
-            )
+        while packets and not is_connection_closed(conn):
+            push_opus_packets(conn, packets)
+            packets = await queue.get()
 
-        conn.tts.tts_text_queue.put(
-            TTSMessageDTO(
-                sentence_id=conn.sentence_id,
-                sentence_type=SentenceType.MIDDLE,
-                content_type=ContentType.TEXT,
-                content_detail=text,
-            )
-        )
+        logger.bind(tag=TAG).info(f"Stream {station_name} terminato")
 
-        conn.tts.tts_text_queue.put(
-            TTSMessageDTO(
-                sentence_id=conn.sentence_id,
-                sentence_type=SentenceType.MIDDLE,
-                content_type=ContentType.FILE,
-                content_file=audio_path,
-            )
+    except asyncio.TimeoutError:
+        await send_stt_message(conn, f"Non riesco a sintonizzare {station_name}")
+    except Exception as e:
+        logger.bind(tag=TAG).error(f"Errore stream radio: {e}")
+    finally:
+        if broadcast is not None:
+            broadcast.unsubscribe(queue)
+        if playing:
+            end_playback(conn)
+
+
+def segment_capture_cmd(url: str, session_dir: str) -> list:
+    """
+    ffmpeg con muxer segment: un solo processo continuo scrive i segmenti
+    a rotazione su SEGMENT_SLOTS file e stampa su stdout il nome di ogni
+    segmento completato. Ogni segmento è un file a sé: al passaggio dall'uno
+    all'altro può sentirsi una breve pausa (lo streaming PCM non ne ha)
+    """
+    return [
+        "ffmpeg",
+        "-loglevel", "error",
+        "-user_agent", USER_AGENT,
+        "-i", url,
+        "-vn",
+        "-c:a", "libmp3lame",
+        "-b:a", "128k",
+        "-f", "segment",
+        "-segment_time", str(SEGMENT_DURATION),
+        "-segment_wrap", str(SEGMENT_SLOTS),
+        "-reset_timestamps", "1",
+        "-segment_list", "pipe:1",
+        "-segment_list_type", "flat",
+        "-y",
+        os.path.join(session_dir, "seg_%d.mp3"),
+    ]
+
+
+def queue_radio_segment(conn, audio_path: str):
+    """Accoda un segmento completato alla riproduzione"""
+    conn.tts.tts_text_queue.put(
+        TTSMessageDTO(
+            sentence_id=conn.sentence_id,
+            sentence_type=SentenceType.MIDDLE,
+            content_type=ContentType.FILE,
+            content_file=audio_path,
         )
+    )
+
 
-        if conn.intent_type == "intent_llm":
-            conn.tts.tts_text_queue.put(
-                TTSMessageDTO(
-                    sentence_id=conn.sentence_id,
-                    sentence_type=SentenceType.LAST,
-                    content_type=ContentType.ACTION,
+async def capture_and_play_radio(conn, station: dict):
+    """Cattura la radio a segmenti: il prossimo si registra mentre il corrente suona"""
+    station_name = station["name"]
+    session_dir = None
+    process = None
+    playing = False
+    cleanup_delay = 0
+    try:
+        await send_stt_message(conn, f"Sintonizzazione su {station_name}...")
+
+        # Directory propria per ogni cattura: una nuova play non collide con la pulizia della precedente
+        os.makedirs(RADIO_CACHE_DIR, exist_ok=True)
+        session_dir = tempfile.mkdtemp(prefix=f"{conn.session_id}_", dir=RADIO_CACHE_DIR)
+        process = await supervisor.spawn(
+            "radio",
+            segment_capture_cmd(resolved_url(station), session_dir),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        track_process(conn, process)
+
+        while not is_connection_closed(conn):
+            line = await asyncio.wait_for(process.stdout.readline(), timeout=SEGMENT_DURATION + 30)
+            if not line:
+                break
+            segment_path = os.path.join(session_dir, os.path.basename(line.decode().strip()))
+
+            if not playing:
+                text = f"Ecco {station_name}!"
+                await send_stt_message(conn, text)
+                conn.dialogue.put(Message(role="assistant", content=text))
+                start_playback(conn)
+                conn.tts.tts_text_queue.put(
+                    TTSMessageDTO(
+                        sentence_id=conn.sentence_id,
+                        sentence_type=SentenceType.MIDDLE,
+                        content_type=ContentType.TEXT,
+                        content_detail=text,
+                    )
                 )
-            )
+                playing = True
+                logger.bind(tag=TAG).info(f"Radio in riproduzione a segmenti: {station_name}")
+
+            queue_radio_segment(conn, segment_path)
 
-        logger.bind(tag=TAG).info(f"Radio in riproduzione: {station_name}")
+        if not playing:
+            await send_stt_message(conn, f"Non riesco a sintonizzare {station_name}")
+        elif not is_connection_closed(conn):
+            # Fine naturale dello stream: lascia suonare i segmenti già in coda
+            cleanup_delay = SEGMENT_DURATION * SEGMENT_SLOTS
 
+    except asyncio.TimeoutError:
+        logger.bind(tag=TAG).error("Timeout cattura radio")
+        await send_stt_message(conn, f"Non riesco a sintonizzare {station_name}")
+    except SupervisorBusy as e:
+        logger.bind(tag=TAG).warning(f"Cattura radio non ammessa: {e}")
+        await send_stt_message(conn, "Troppe richieste audio in corso, riprova tra poco")
     except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore riproduzione radio: {e}")
+        logger.bind(tag=TAG).error(f"Errore capture_and_play_radio: {e}")
+    finally:
+        if process is not None:
+            await kill_process(process)
+            untrack_process(conn, process)
+        if playing:
+            end_playback(conn)
+        if session_dir is not None:
+            conn.loop.call_later(cleanup_delay, shutil.rmtree, session_dir, True)
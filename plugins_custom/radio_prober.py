@@ -0,0 +1,144 @@
+"""
+Radio Prober - Controllo periodico delle stazioni radio in background
+Risolve le playlist HLS master nella variante a bitrate più basso, misura il
+time-to-first-byte e tiene lo stato up/down di ogni stazione, così la
+riproduzione usa un endpoint già risolto e fallisce subito se la radio è giù
+"""
+
+import re
+import time
+import asyncio
+from urllib.parse import urljoin
+from config.logger import setup_logging
+from plugins_func.functions.http_client import http_get
+
+TAG = __name__
+logger = setup_logging()
+
+PROBE_INTERVAL = 600  # Secondi tra due giri di controllo
+PROBE_TIMEOUT = 8  # Timeout per singola richiesta
+
+# Banda minima accettata per le varianti HLS (sotto si perde troppa qualità)
+MIN_VARIANT_BANDWIDTH = 48000
+
+# Oltre questo tempo un "down" non è più considerato affidabile
+STATUS_MAX_AGE = PROBE_INTERVAL * 2
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+# url originale -> {"url", "up", "ttfb_ms", "checked_at", "error"}
+station_status = {}
+
+_prober_task = None
+
+
+def parse_hls_master(text: str, base_url: str) -> list:
+    """Estrae (bandwidth, url) dalle varianti di una playlist HLS master"""
+    variants = []
+    lines = [line.strip() for line in text.splitlines()]
+    for i, line in enumerate(lines):
+        if not line.startswith("#EXT-X-STREAM-INF"):
+            continue
+        match = re.search(r"[:,]BANDWIDTH=(\d+)", line)
+        bandwidth = int(match.group(1)) if match else 0
+        for uri in lines[i + 1:]:
+            if uri and not uri.startswith("#"):
+                variants.append((bandwidth, urljoin(base_url, uri)))
+                break
+    return variants
+
+
+def pick_variant(variants: list) -> str:
+    """Sceglie la variante più leggera che rispetta MIN_VARIANT_BANDWIDTH"""
+    if not variants:
+        return None
+    ordered = sorted(variants)
+    for bandwidth, url in ordered:
+        if bandwidth >= MIN_VARIANT_BANDWIDTH:
+            return url
+    return ordered[-1][1]
+
+
+def _first_bytes(url: str):
+    """GET in streaming: restituisce (ttfb_ms, primi byte, content-type)"""
+    start = time.monotonic()
+    with http_get(url, headers=HEADERS, timeout=PROBE_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        chunk = next(response.iter_content(4096), b"")
+        ttfb_ms = (time.monotonic() - start) * 1000
+        return ttfb_ms, chunk, response.headers.get("Content-Type", "")
+
+
+def probe_station(url: str) -> dict:
+    """Controlla una stazione e risolve l'eventuale playlist HLS master"""
+    status = {"url": url, "up": False, "ttfb_ms": None, "checked_at": time.time(), "error": None}
+    try:
+        ttfb_ms, chunk, _ = _first_bytes(url)
+        if not chunk:
+            status["error"] = "nessun dato"
+            return status
+
+        if b"#EXT-X-STREAM-INF" in chunk:
+            # Playlist master: serve il testo completo per leggere tutte le varianti
+            response = http_get(url, headers=HEADERS, timeout=PROBE_TIMEOUT)
+            response.raise_for_status()
+            variant = pick_variant(parse_hls_master(response.text, response.url))
+            if variant:
+                ttfb_ms, chunk, _ = _first_bytes(variant)
+                status["url"] = variant
+
+        status["up"] = bool(chunk)
+        status["ttfb_ms"] = round(ttfb_ms)
+    except Exception as e:
+        status["error"] = str(e)[:100]
+    return status
+
+
+async def probe_all(stations: dict):
+    """Controlla tutte le stazioni in parallelo"""
+    loop = asyncio.get_running_loop()
+    urls = [s["url"] for s in stations.values()]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(None, probe_station, url) for url in urls)
+    )
+    for url, status in zip(urls, results):
+        station_status[url] = status
+
+    down = [u for u, s in station_status.items() if not s["up"]]
+    logger.bind(tag=TAG).info(f"Controllo radio: {len(urls) - len(down)}/{len(urls)} raggiungibili")
+
+
+async def _probe_loop(stations: dict):
+    while True:
+        try:
+            await probe_all(stations)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.bind(tag=TAG).error(f"Errore controllo radio: {e}")
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+def ensure_prober_started(loop, stations: dict):
+    """Avvia il controllo periodico la prima volta che viene chiamato (da qualsiasi thread)"""
+    global _prober_task
+    if _prober_task is None or _prober_task.done():
+        _prober_task = asyncio.run_coroutine_threadsafe(_probe_loop(stations), loop)
+
+
+def resolved_url(station: dict) -> str:
+    """Endpoint da usare per la riproduzione (variante HLS già risolta se disponibile)"""
+    status = station_status.get(station["url"])
+    if status and status["up"]:
+        return status["url"]
+    return station["url"]
+
+
+def is_station_down(station: dict) -> bool:
+    """True solo se un controllo recente ha trovato la stazione irraggiungibile"""
+    status = station_status.get(station["url"])
+    if not status or status["up"]:
+        return False
+    return time.time() - status["checked_at"] < STATUS_MAX_AGE
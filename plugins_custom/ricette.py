@@ -3,9 +3,10 @@ Ricette Italiane Plugin - Cerca ricette di cucina italiana
 Usa l'API gratuita TheMealDB
 """
 
-import requests
 from config.logger import setup_logging
-from plugins_func.register import register_function, ToolType, ActionResponse, Action
+from plugins_func.register import ToolType, ActionResponse, Action
+from plugins_func.functions.http_client import http_get
+from plugins_func.functions.async_plugins import register_blocking_function
 
 TAG = __name__
 logger = setup_logging()
@@ -61,7 +62,7 @@ def search_by_name(query: str) -> list:
     """Cerca ricette per nome"""
     try:
         url = f"https://www.themealdb.com/api/json/v1/1/search.php?s={query}"
-        response = requests.get(url, timeout=10)
+        response = http_get(url)
         data = response.json()
         return data.get("meals") or []
     except:
@@ -72,7 +73,7 @@ def search_by_ingredient(ingredient: str) -> list:
     """Cerca ricette per ingrediente"""
     try:
         url = f"https://www.themealdb.com/api/json/v1/1/filter.php?i={ingredient}"
-        response = requests.get(url, timeout=10)
+        response = http_get(url)
         data = response.json()
         return data.get("meals") or []
     except:
@@ -83,7 +84,7 @@ def get_recipe_details(meal_id: str) -> dict:
     """Ottiene i dettagli completi di una ricetta"""
     try:
         url = f"https://www.themealdb.com/api/json/v1/1/lookup.php?i={meal_id}"
-        response = requests.get(url, timeout=10)
+        response = http_get(url)
         data = response.json()
         meals = data.get("meals")
         return meals[0] if meals else None
@@ -116,7 +117,7 @@ def format_recipe(meal: dict) -> str:
     return result
 
 
-@register_function("ricette", RICETTE_FUNCTION_DESC, ToolType.SYSTEM_CTL)
+@register_blocking_function("ricette", RICETTE_FUNCTION_DESC, ToolType.SYSTEM_CTL)
 def ricette(conn, query: str, tipo: str = "piatto"):
     if not query:
         return ActionResponse(Action.REQLLM, "Cosa vuoi cucinare?", None)
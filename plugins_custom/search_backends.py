@@ -0,0 +1,232 @@
+"""
+Search Backends - Motori di ricerca intercambiabili per web_search con richieste "hedged"
+DuckDuckGo HTML, DuckDuckGo lite e (se configurato) un SearxNG self-hosted, ognuno
+con il suo parser (eseguito in un thread, fuori dalla loop). Si interroga il motore più affidabile; se non risponde entro il
+suo tempo tipico (percentile delle latenze recenti) parte in parallelo il successivo
+e vince la prima risposta con risultati
+"""
+
+import os
+import abc
+import time
+import asyncio
+import urllib.parse
+from collections import deque
+from config.logger import setup_logging
+from plugins_func.functions.http_client import http_get_async, http_post_async
+
+TAG = __name__
+logger = setup_logging()
+
+# SearxNG self-hosted (es. http://127.0.0.1:8888); vuoto = non usato
+SEARXNG_URL = os.environ.get("SEARXNG_URL", "")
+
+SEARCH_DEADLINE = 8  # Secondi massimi per l'intera ricerca, tentativi paralleli compresi
+HEDGE_PERCENTILE = 0.9  # Latenza oltre la quale si avvia il motore successivo
+HEDGE_MIN_DELAY = 0.4
+HEDGE_MAX_DELAY = 3.0
+HEDGE_DEFAULT_DELAY = 1.5  # Senza misure sufficienti
+LATENCY_SAMPLES = 50
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    )
+}
+
+
+def _ddg_target(href: str) -> str:
+    """DuckDuckGo usa un redirect: estrae l'URL reale dal parametro uddg"""
+    if 'uddg=' in href:
+        parsed = urllib.parse.parse_qs(urllib.parse.urlparse(href).query)
+        return parsed.get('uddg', [''])[0]
+    return href
+
+
+class SearchBackend(abc.ABC):
+    """Un motore: richiesta HTTP più parser; tiene le latenze recenti per l'hedging"""
+
+    name = "base"
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.failures = 0  # Fallimenti consecutivi (errore o nessun risultato)
+
+    @abc.abstractmethod
+    async def request(self, query: str, lang: str):
+        """Risposta HTTP del motore per la query"""
+
+    @abc.abstractmethod
+    def parse(self, response, num_results: int) -> list:
+        """Risultati {title, snippet, url} dalla risposta; gira in un thread"""
+
+    async def search(self, query: str, num_results: int, lang: str) -> list:
+        started = time.monotonic()
+        try:
+            response = await self.request(query, lang)
+            response.raise_for_status()
+            # BeautifulSoup su una pagina di risultati costa decine di ms: non sulla loop
+            results = await asyncio.get_running_loop().run_in_executor(None, self.parse, response, num_results)
+        except asyncio.CancelledError:
+            # Superato da un altro motore: il tempo trascorso è un minimo della sua latenza
+            elapsed = time.monotonic() - started
+            if elapsed >= self.hedge_delay():
+                self.latencies.append(elapsed)
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.bind(tag=TAG).warning(f"Ricerca {self.name} fallita: {e}")
+            return []
+        self.latencies.append(time.monotonic() - started)
+        self.failures = 0 if results else self.failures + 1
+        return results
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < 5:
+            return HEDGE_DEFAULT_DELAY
+        ordered = sorted(self.latencies)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE))]
+        return min(max(value, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+
+class DuckDuckGoHtml(SearchBackend):
+    name = "ddg_html"
+
+    def __init__(self, url: str = "https://html.duckduckgo.com/html/"):
+        super().__init__(url)
+
+    async def request(self, query: str, lang: str):
+        return await http_post_async(self.url, data={"q": query, "kl": f"{lang}-{lang}"}, headers=HEADERS)
+
+    def parse(self, response, num_results: int) -> list:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response.text, "html.parser")
+
+        results = []
+        for result in soup.select(".result")[:num_results]:
+            title_elem = result.select_one(".result__title")
+            snippet_elem = result.select_one(".result__snippet")
+            link_elem = result.select_one(".result__a")  # Link completo
+            if title_elem and snippet_elem:
+                results.append({
+                    "title": title_elem.get_text(strip=True),
+                    "snippet": snippet_elem.get_text(strip=True),
+                    "url": _ddg_target(link_elem.get('href', '')) if link_elem else "",
+                })
+        return results
+
+
+class DuckDuckGoLite(SearchBackend):
+    name = "ddg_lite"
+
+    def __init__(self, url: str = "https://lite.duckduckgo.com/lite/"):
+        super().__init__(url)
+
+    async def request(self, query: str, lang: str):
+        return await http_post_async(self.url, data={"q": query, "kl": f"{lang}-{lang}"}, headers=HEADERS)
+
+    def parse(self, response, num_results: int) -> list:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response.text, "html.parser")
+
+        # Tabella: riga con il link, riga con lo snippet, riga con l'indirizzo. Lo snippet
+        # si cerca solo nelle righe fino al link successivo, così un risultato senza
+        # snippet non sposta quelli dopo
+        results = []
+        for link in soup.select("a.result-link"):
+            snippet = ""
+            row = link.find_parent("tr")
+            for sibling in row.find_next_siblings("tr") if row else ():
+                if sibling.select_one("a.result-link"):
+                    break
+                cell = sibling.select_one("td.result-snippet")
+                if cell:
+                    snippet = cell.get_text(strip=True)
+                    break
+            results.append({
+                "title": link.get_text(strip=True),
+                "snippet": snippet,
+                "url": _ddg_target(link.get('href', '')),
+            })
+            if len(results) >= num_results:
+                break
+        return results
+
+
+class SearxNG(SearchBackend):
+    name = "searxng"
+
+    async def request(self, query: str, lang: str):
+        return await http_get_async(
+            self.url.rstrip("/") + "/search",
+            params={"q": query, "format": "json", "language": lang},
+            headers=HEADERS,
+        )
+
+    def parse(self, response, num_results: int) -> list:
+        return [
+            {"title": r.get("title", ""), "snippet": r.get("content", ""), "url": r.get("url", "")}
+            for r in response.json().get("results", [])[:num_results]
+            if r.get("url")
+        ]
+
+
+class HedgedSearch:
+    """Interroga i motori in ordine di affidabilità, aggiungendone uno a ogni ritardo di hedging"""
+
+    def __init__(self, backends: list, deadline: float = SEARCH_DEADLINE):
+        self.backends = backends
+        self.deadline = deadline
+        self.wins = {backend.name: 0 for backend in backends}
+
+    def _ordered(self) -> list:
+        # Prima chi non sta fallendo, poi il più veloce
+        return sorted(self.backends, key=lambda b: (b.failures > 0, b.hedge_delay()))
+
+    async def search(self, query: str, num_results: int, lang: str = "it") -> list:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        waiting = self._ordered()
+        running = {}  # task -> backend
+
+        try:
+            while waiting or running:
+                if waiting and (not running or loop.time() >= next_start):
+                    backend = waiting.pop(0)
+                    running[loop.create_task(backend.search(query, num_results, lang))] = backend
+                    next_start = loop.time() + backend.hedge_delay()
+
+                timeout = deadline - loop.time()
+                if waiting:
+                    timeout = min(timeout, next_start - loop.time())
+                if timeout <= 0 and not waiting:
+                    break
+                done, _ = await asyncio.wait(running, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    backend = running.pop(task)
+                    results = task.result()
+                    if results:
+                        self.wins[backend.name] += 1
+                        return results
+                if loop.time() >= deadline:
+                    break
+            logger.bind(tag=TAG).warning(f"Nessun motore ha risposto per '{query}'")
+            return []
+        finally:
+            for task in running:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            b.name: {"failures": b.failures, "hedge_delay": round(b.hedge_delay(), 2), "wins": self.wins[b.name]}
+            for b in self.backends
+        }
+
+
+def default_backends() -> list:
+    backends = [DuckDuckGoHtml(), DuckDuckGoLite()]
+    if SEARXNG_URL:
+        backends.append(SearxNG(SEARXNG_URL))
+    return backends
@@ -0,0 +1,129 @@
+"""
+Search Cache - Cache dedicata ai risultati di web_search
+Chiave = query normalizzata (minuscole, senza accenti, spazi uniformi; ordine delle
+parole e simboli come + e # restano, "volo Roma Milano" non è "volo Milano Roma") + lingua;
+una voce con più risultati serve anche le richieste con num_results minore.
+La durata dipende dal tipo di query (attualità o argomento stabile) e, scaduta,
+la voce viene ancora servita per un po' mentre si aggiorna in background
+(stale-while-revalidate); ricerche identiche in corso vengono unite in un task
+separato, che continua anche se chi l'ha avviato viene annullato
+"""
+
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from config.logger import setup_logging
+from plugins_func.functions.text_utils import canonical_text, tokenize
+
+TAG = __name__
+logger = setup_logging()
+
+MAX_ENTRIES = 512
+# Risultati chiesti comunque al motore: una pagina costa uguale e serve tutte le richieste successive
+MIN_FETCH_RESULTS = 10
+
+# (fresca, servibile ancora mentre si aggiorna) in secondi
+NEWS_TTL = (10 * 60, 60 * 60)
+EVERGREEN_TTL = (24 * 3600, 7 * 24 * 3600)
+
+# Parole che indicano una query legata all'attualità (valori che cambiano spesso)
+NEWS_WORDS = frozenset("""
+oggi ieri domani stasera ora adesso ultime ultima ultimo notizie news breaking
+prezzo prezzi costo quotazione quotazioni cambio borsa bitcoin btc euro dollaro
+risultato risultati partita classifica diretta live meteo traffico sciopero
+elezioni sondaggi sondaggio morto morta arrestato incidente terremoto
+""".split())
+_YEAR_RE = re.compile(r"^20\d\d$")
+
+
+def query_ttl(query: str) -> tuple:
+    """Durate (fresca, stale) in base al tipo di query"""
+    for token in tokenize(query):
+        if token in NEWS_WORDS or _YEAR_RE.match(token):
+            return NEWS_TTL
+    return EVERGREEN_TTL
+
+
+class SearchCache:
+    """Cache LRU delle ricerche con riuso tra num_results diversi e stale-while-revalidate"""
+
+    def __init__(self, fetch, max_entries: int = MAX_ENTRIES):
+        self.fetch = fetch  # async fetch(query, num_results, lang) -> list
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (query normalizzata, lingua) -> voce
+        self._inflight = {}  # chiave -> task della ricerca in corso
+        self.stats_counts = {"fresh": 0, "stale": 0, "miss": 0, "shared": 0}
+
+    def _lookup(self, key, num_results: int) -> dict:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            # Basta se la voce ha abbastanza risultati o se la ricerca ne aveva chiesti almeno tanti
+            if len(entry["results"]) < num_results and entry["requested"] < num_results:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, results: list, requested: int, query: str):
+        fresh, stale = query_ttl(query)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = {
+                "results": results,
+                "requested": requested,
+                "fresh_until": now + fresh,
+                "stale_until": now + stale,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def _fetch(self, key, query: str, num_results: int, lang: str) -> list:
+        requested = max(num_results, MIN_FETCH_RESULTS)
+        results = await self.fetch(query, requested, lang)
+        if results:
+            self._store(key, results, requested, query)
+        return results
+
+    def _start_fetch(self, key, query: str, num_results: int, lang: str) -> asyncio.Task:
+        """Task della ricerca per la chiave, nuovo o già in corso; non appartiene a nessun chiamante"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats_counts["shared"] += 1
+            return task
+        task = asyncio.get_running_loop().create_task(self._fetch(key, query, num_results, lang))
+        self._inflight[key] = task
+
+        def done(finished):
+            if self._inflight.get(key) is finished:
+                del self._inflight[key]
+            if not finished.cancelled() and finished.exception() is not None:
+                logger.bind(tag=TAG).warning(f"Ricerca '{query}' fallita: {finished.exception()}")
+
+        task.add_done_callback(done)
+        return task
+
+    async def get(self, query: str, lang: str, num_results: int) -> list:
+        key = (canonical_text(query), lang)
+        entry = self._lookup(key, num_results)
+        now = time.monotonic()
+        if entry is not None and now < entry["fresh_until"]:
+            self.stats_counts["fresh"] += 1
+            return entry["results"][:num_results]
+        if entry is not None and now < entry["stale_until"]:
+            self.stats_counts["stale"] += 1
+            self._start_fetch(key, query, max(num_results, entry["requested"]), lang)
+            return entry["results"][:num_results]
+
+        self.stats_counts["miss"] += 1
+        # shield: se questo chiamante viene annullato la ricerca prosegue per gli altri e per la cache
+        results = await asyncio.shield(self._start_fetch(key, query, num_results, lang))
+        return (results or [])[:num_results]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats_counts, entries=len(self._entries), inflight=len(self._inflight))
@@ -0,0 +1,84 @@
+"""
+Session Store - Dati temporanei per sessione/dispositivo condivisi tra i plugin
+Ogni sessione ha un numero limitato di voci con scadenza (TTL); oltre il numero
+massimo di sessioni viene scartata quella usata meno di recente, così la memoria
+resta piatta anche con migliaia di connessioni
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+PURGE_INTERVAL = 60  # Secondi tra due pulizie complete delle voci scadute
+
+
+def session_key(conn) -> str:
+    """Chiave della sessione: id del dispositivo se noto (sopravvive alle riconnessioni)"""
+    return getattr(conn, "device_id", None) or conn.session_id
+
+
+class SessionStore:
+    """Mappa sessione -> {chiave: valore} limitata per sessione e per numero di sessioni, con TTL"""
+
+    def __init__(self, name: str, ttl: float, max_items: int, max_sessions: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # sessione -> OrderedDict(chiave -> (scadenza, valore))
+        self._next_purge = time.monotonic() + PURGE_INTERVAL
+
+    def put(self, session: str, key, value, ttl: float = None):
+        now = time.monotonic()
+        expires = now + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            if now >= self._next_purge:
+                self._purge(now)
+            items = self._sessions.get(session)
+            if items is None:
+                items = self._sessions[session] = OrderedDict()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session)
+            items[key] = (expires, value)
+            items.move_to_end(key)
+            while len(items) > self.max_items:
+                items.popitem(last=False)
+
+    def get(self, session: str, key, default=None):
+        with self._lock:
+            items = self._sessions.get(session)
+            if items is None:
+                return default
+            entry = items.get(key)
+            if entry is None:
+                return default
+            if entry[0] < time.monotonic():
+                del items[key]
+                if not items:
+                    del self._sessions[session]
+                return default
+            return entry[1]
+
+    def clear(self, session: str):
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def _purge(self, now: float):
+        """Rimuove tutte le voci scadute (chiamare con lock); get lo fa solo sulla voce letta"""
+        self._next_purge = now + PURGE_INTERVAL
+        for session in list(self._sessions):
+            items = self._sessions[session]
+            for key in [k for k, (expires, _v) in items.items() if expires < now]:
+                del items[key]
+            if not items:
+                del self._sessions[session]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "items": sum(len(items) for items in self._sessions.values()),
+            }
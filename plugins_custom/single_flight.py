@@ -0,0 +1,95 @@
+"""
+Single Flight - Coalescenza di richieste identiche in corso
+Mentre un lavoro per una chiave è in esecuzione, chi arriva dopo con la stessa
+chiave si aggancia e riceve lo stesso risultato invece di ripetere la chiamata.
+Funziona sia da thread (do) sia da coroutine (do_async), ma le due modalità
+hanno lavori in corso separati: un chiamante in thread e uno sulla loop con la
+stessa chiave non si agganciano. Ogni istanza va usata in una sola modalità
+"""
+
+import asyncio
+import threading
+from config.logger import setup_logging
+
+TAG = __name__
+logger = setup_logging()
+
+
+class FlightAbandoned(Exception):
+    """Il lavoro condiviso è stato annullato da chi lo stava eseguendo"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Un solo lavoro in corso per chiave; gli altri chiamanti attendono il suo esito"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        # Mappe separate: do() e do_async() non condividono i lavori in corso
+        self._calls = {}  # chiave -> _Call (chiamanti sincroni)
+        self._futures = {}  # chiave -> asyncio.Future (chiamanti asincroni, stessa loop)
+        self.shared = 0  # chiamate servite agganciandosi a un lavoro già in corso
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls or key in self._futures
+
+    def do(self, key, func, *args):
+        """Versione bloccante, per codice che gira in thread"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def do_async(self, key, func, *args):
+        """Versione asincrona: func è una coroutine function"""
+        future = self._futures.get(key)
+        if future is not None:
+            self.shared += 1
+            logger.bind(tag=TAG).debug(f"{self.name}: agganciato a lavoro in corso per {key}")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await func(*args)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Annullamento, KeyboardInterrupt, SystemExit...: chi attende non deve restare appeso
+            future.set_exception(FlightAbandoned(f"{self.name}: lavoro per {key} annullato"))
+            raise
+        finally:
+            self._futures.pop(key, None)
+            if future.done() and not future.cancelled():
+                future.exception()  # evita il warning "exception was never retrieved"
@@ -0,0 +1,114 @@
+"""
+Summarizer - Riassunto estrattivo locale (solo CPU) per ridurre i token inviati all'LLM
+Divide il testo in frasi, le pesa con TF-IDF sulle radici italiane e le ordina con
+TextRank; se c'è una domanda dell'utente premia le frasi più simili alla domanda.
+Tiene le frasi migliori, nell'ordine originale, entro un budget di token
+"""
+
+import math
+from collections import Counter
+from plugins_func.functions.text_utils import content_terms, split_sentences
+
+CHARS_PER_TOKEN = 3.5  # Stima per testo italiano con i tokenizer BPE comuni
+MIN_SENTENCE_TERMS = 4  # Frasi più corte (titoletti, "leggi anche") non vengono scelte
+MAX_SENTENCES = 150  # TextRank è quadratico: oltre si tengono solo le prime frasi
+DAMPING = 0.85
+ITERATIONS = 30
+QUESTION_WEIGHT = 0.6  # Peso della somiglianza con la domanda rispetto a TextRank
+POSITION_WEIGHT = 0.1  # Piccolo vantaggio per le prime frasi (attacco dell'articolo)
+REDUNDANCY_THRESHOLD = 0.7  # Frasi troppo simili a una già scelta vengono saltate
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _tfidf_vectors(term_lists: list) -> list:
+    documents = len(term_lists)
+    df = Counter(term for terms in term_lists for term in set(terms))
+    vectors = []
+    for terms in term_lists:
+        counts = Counter(terms)
+        vector = {term: count * (math.log(documents / df[term]) + 1) for term, count in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        vectors.append({term: w / norm for term, w in vector.items()})
+    return vectors
+
+
+def _cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(term, 0.0) for term, w in a.items())
+
+
+def _textrank(vectors: list) -> list:
+    n = len(vectors)
+    edges = [[] for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            weight = _cosine(vectors[i], vectors[j])
+            if weight > 0:
+                edges[i].append((j, weight))
+                edges[j].append((i, weight))
+    out_weight = [sum(w for _j, w in links) or 1.0 for links in edges]
+
+    scores = [1.0] * n
+    for _ in range(ITERATIONS):
+        scores = [
+            (1 - DAMPING) + DAMPING * sum(scores[j] * w / out_weight[j] for j, w in edges[i])
+            for i in range(n)
+        ]
+    return scores
+
+
+def _normalized(values: list) -> list:
+    top = max(values) if values else 0
+    return [v / top for v in values] if top > 0 else [0.0] * len(values)
+
+
+def summarize(text: str, question: str = None, token_budget: int = 400) -> str:
+    """Frasi più rilevanti del testo (per la domanda, se data) entro token_budget"""
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    sentences = split_sentences(text)[:MAX_SENTENCES]
+    term_lists = [content_terms(s) for s in sentences]
+    candidates = [i for i, terms in enumerate(term_lists) if len(terms) >= MIN_SENTENCE_TERMS]
+    if not candidates:
+        return text[:int(token_budget * CHARS_PER_TOKEN)]
+
+    vectors = _tfidf_vectors([term_lists[i] for i in candidates])
+    rank = _normalized(_textrank(vectors))
+
+    question_terms = content_terms(question) if question else []
+    if question_terms:
+        question_vector = _tfidf_vectors([question_terms])[0]
+        relevance = _normalized([_cosine(question_vector, v) for v in vectors])
+        scores = [(1 - QUESTION_WEIGHT) * r + QUESTION_WEIGHT * q for r, q in zip(rank, relevance)]
+    else:
+        scores = rank
+
+    total = len(sentences)
+    scored = sorted(
+        ((score + POSITION_WEIGHT * (1 - i / total), i, vector)
+         for score, i, vector in zip(scores, candidates, vectors)),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+
+    chosen = []
+    chosen_vectors = []
+    used = 0
+    for _score, i, vector in scored:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > token_budget:
+            continue
+        if any(_cosine(vector, other) > REDUNDANCY_THRESHOLD for other in chosen_vectors):
+            continue
+        chosen.append(i)
+        chosen_vectors.append(vector)
+        used += cost
+    if not chosen:
+        best = sentences[scored[0][1]]
+        return best[:int(token_budget * CHARS_PER_TOKEN)]
+    return " ".join(sentences[i] for i in sorted(chosen))
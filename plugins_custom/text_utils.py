@@ -0,0 +1,87 @@
+"""
+Text Utils - Normalizzazione testo condivisa tra i plugin
+Minuscole, rimozione accenti e tokenizzazione per confrontare query e titoli;
+stopword, stemming leggero e divisione in frasi per l'italiano
+"""
+
+import re
+import unicodedata
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text: str) -> str:
+    """Minuscolo e senza accenti: 'Perché Città' -> 'perche citta'"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> list:
+    """Parole alfanumeriche normalizzate, nell'ordine originale"""
+    return _TOKEN_RE.findall(fold_accents(text))
+
+
+def normalize_query(text: str) -> str:
+    """Chiave canonica di una query: token unici in ordine alfabetico"""
+    return " ".join(sorted(set(tokenize(text))))
+
+
+def canonical_text(text: str) -> str:
+    """Minuscolo, senza accenti e con spazi uniformi, ma con ordine e simboli intatti ('C++ Città' -> 'c++ citta')"""
+    return " ".join(fold_accents(text).split())
+
+
+ITALIAN_STOPWORDS = frozenset("""
+a ad al allo ai agli all alla alle anche ancora avere aveva avevano c che chi ci
+coi col come con contro cui da dal dallo dai dagli dall dalla dalle degli dei del
+dell della delle dello dentro di dopo dove e ed era erano essere gli ha hai hanno
+ho i il in io l la le lei li lo loro lui ma mi mia mie miei mio ne negli nei nel
+nell nella nelle nello noi non nostra nostro o per perche piu poi quale quando
+quanto quella quelle quelli quello questa queste questi questo se sei sia siamo
+sono su sua sue sugli sui sul sull sulla sulle suo suoi ti tra tu tua tue tuo
+tuoi tutti tutto un una uno vi voi fra gia cosa cose molto stato stata stati
+essere fa fare fatto puo possono deve viene vengono solo senza sempre cosi oltre
+""".split())
+
+# Suffissi flessionali e derivativi più comuni, dal più lungo al più corto
+_IT_SUFFIXES = (
+    "azione", "azioni", "amente", "imento", "imenti", "mente", "abile", "ibile",
+    "ismo", "ismi", "ista", "iste", "isti", "ando", "endo", "ato", "ata", "ati",
+    "ate", "uto", "uta", "uti", "ute", "ito", "ita", "iti", "ite", "are", "ere",
+    "ire", "ale", "ali",
+)
+_IT_FINAL_VOWELS = "aeio"
+
+
+def stem_it(word: str) -> str:
+    """Stemming leggero italiano: 'elezioni', 'elezione' -> 'elezion'"""
+    if len(word) > 5:
+        for suffix in _IT_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                return word[:-len(suffix)]
+    if len(word) > 3 and word[-1] in _IT_FINAL_VOWELS:
+        return word[:-1]
+    return word
+
+
+def content_terms(text: str) -> list:
+    """Radici delle parole significative (senza stopword), per confronti e indici"""
+    return [stem_it(t) for t in tokenize(text) if len(t) > 1 and t not in ITALIAN_STOPWORDS]
+
+
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?…])["»”)]?\s+(?=["«“(]?[A-ZÀ-Ý0-9])')
+_ABBREVIATIONS = ("es.", "dott.", "sig.", "sigg.", "prof.", "pag.", "n.", "art.", "ing.", "avv.", "on.")
+
+
+def split_sentences(text: str) -> list:
+    """Divide un testo in frasi, senza spezzare le abbreviazioni più comuni"""
+    sentences = []
+    for part in _SENTENCE_END_RE.split(text or ""):
+        part = part.strip()
+        if not part:
+            continue
+        if sentences and sentences[-1].lower().endswith(_ABBREVIATIONS):
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
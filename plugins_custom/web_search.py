@@ -1,18 +1,24 @@
 """
 Web Search Plugin for Xiaozhi ESP32 Server
 Permette al chatbot di cercare informazioni sul web in tempo reale.
-Usa DuckDuckGo (gratuito, senza API key)
+Usa DuckDuckGo (gratuito, senza API key) ed eventualmente un SearxNG self-hosted
 """
 
-import requests
+import asyncio
+from urllib.parse import urlsplit
 from config.logger import setup_logging
-from plugins_func.register import register_function, ToolType, ActionResponse, Action
+from plugins_func.register import ToolType, ActionResponse, Action
+from plugins_func.functions.async_plugins import register_async_function
+from plugins_func.functions.session_store import SessionStore, session_key
+from plugins_func.functions.search_cache import SearchCache
+from plugins_func.functions.search_backends import HedgedSearch, default_backends
 
 TAG = __name__
 logger = setup_logging()
 
-# Cache globale per salvare gli ultimi risultati con URL completi
-last_search_results = []
+# Ultimi risultati (con URL completi) di ogni sessione, per "leggi il primo risultato"
+SEARCH_RESULTS_TTL = 1800
+search_results = SessionStore("risultati_ricerca", ttl=SEARCH_RESULTS_TTL, max_items=1)
 
 WEB_SEARCH_FUNCTION_DESC = {
     "type": "function",
@@ -22,7 +28,8 @@ WEB_SEARCH_FUNCTION_DESC = {
             "搜索网络信息 / Cerca informazioni sul web in tempo reale. "
             "当用户询问最新信息、新闻、价格、当前事件时使用此功能。"
             "Use when user asks: 'cerca su google', 'cerca su internet', 'cerca online', "
-            "'google...', 'search...', 'cerca...', 'qual è il prezzo di...', 'cosa è successo...'"
+            "'google...', 'search...', 'cerca...', 'qual è il prezzo di...', 'cosa è successo...'. "
+            "Per confronti ('prezzo iPhone vs Samsung') passa tutte le ricerche insieme in 'queries'"
         ),
         "parameters": {
             "type": "object",
@@ -31,6 +38,11 @@ WEB_SEARCH_FUNCTION_DESC = {
                     "type": "string",
                     "description": "La query di ricerca da cercare sul web",
                 },
+                "queries": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Più ricerche da fare in parallelo in una sola chiamata (max 4), es. per confronti",
+                },
                 "num_results": {
                     "type": "integer",
                     "description": "Numero di risultati da restituire (default: 5, max: 10)",
@@ -40,89 +52,87 @@ WEB_SEARCH_FUNCTION_DESC = {
                     "description": "Lingua dei risultati: it (italiano), en (inglese), etc. Default: it",
                 },
             },
-            "required": ["query"],
+            "required": [],
         },
     },
 }
 
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-}
-
-
-def search_duckduckgo(query: str, num_results: int = 5, lang: str = "it") -> list:
-    """
-    Cerca su DuckDuckGo usando l'API HTML (gratuita)
-    """
-    global last_search_results
-    try:
-        url = "https://html.duckduckgo.com/html/"
-        params = {
-            "q": query,
-            "kl": f"{lang}-{lang}",
-        }
-
-        response = requests.post(url, data=params, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        results = []
-        for result in soup.select(".result")[:num_results]:
-            title_elem = result.select_one(".result__title")
-            snippet_elem = result.select_one(".result__snippet")
-            link_elem = result.select_one(".result__a")  # Link completo
-
-            if title_elem and snippet_elem:
-                title = title_elem.get_text(strip=True)
-                snippet = snippet_elem.get_text(strip=True)
-                # Estrai URL completo dall'href
-                full_url = ""
-                if link_elem and link_elem.get('href'):
-                    href = link_elem.get('href')
-                    # DuckDuckGo usa redirect, estrai URL reale
-                    if 'uddg=' in href:
-                        import urllib.parse
-                        parsed = urllib.parse.parse_qs(urllib.parse.urlparse(href).query)
-                        full_url = parsed.get('uddg', [''])[0]
-                    else:
-                        full_url = href
-
-                results.append({
-                    "title": title,
-                    "snippet": snippet,
-                    "url": full_url
-                })
-
-        # Salva risultati per uso successivo (leggi_pagina)
-        last_search_results = results
-        return results
-
-    except Exception as e:
-        logger.bind(tag=TAG).error(f"Errore ricerca DuckDuckGo: {e}")
-        return []
-
-
-@register_function("web_search", WEB_SEARCH_FUNCTION_DESC, ToolType.SYSTEM_CTL)
-def web_search(conn, query: str, num_results: int = 5, lang: str = "it"):
-    from core.utils.cache.manager import cache_manager, CacheType
-
-    if not query:
+# Ricerche multiple: eseguite in parallelo entro una scadenza comune
+MAX_QUERIES = 4
+MULTI_QUERY_DEADLINE = 10  # Secondi; le ricerche non concluse vengono scartate
+MULTI_QUERY_MIN_RESULTS = 3  # Risultati minimi per ricerca, anche con molte query
+
+# Motori interrogati in parallelo "hedged": DuckDuckGo HTML, DuckDuckGo lite, SearxNG se configurato
+search_backend = HedgedSearch(default_backends())
+
+
+# Cache dedicata: query normalizzate, durata per tipo di query, aggiornamento in background
+search_cache = SearchCache(search_backend.search)
+
+
+def get_search_result(conn, numero: int) -> dict:
+    """Risultato numero N (da 1) dell'ultima ricerca della sessione, o None"""
+    results = search_results.get(session_key(conn), "last") or []
+    if 0 < numero <= len(results):
+        return results[numero - 1]
+    return None
+
+
+def _url_key(url: str) -> str:
+    """Chiave per riconoscere lo stesso risultato in ricerche diverse"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    return f"{host}{parts.path.rstrip('/')}?{parts.query}"
+
+
+async def _search_many(queries: list, lang: str, per_query: int) -> list:
+    """Esegue le ricerche in parallelo; per ognuna i risultati (lista vuota se non conclusa in tempo)"""
+    tasks = [asyncio.ensure_future(search_cache.get(q, lang, per_query)) for q in queries]
+    _done, pending = await asyncio.wait(tasks, timeout=MULTI_QUERY_DEADLINE)
+    for task in pending:
+        task.cancel()
+        logger.bind(tag=TAG).warning(f"Ricerca '{queries[tasks.index(task)]}' oltre la scadenza, scartata")
+
+    results = []
+    for q, task in zip(queries, tasks):
+        if task in pending or task.exception() is not None:
+            if task not in pending:
+                logger.bind(tag=TAG).error(f"Errore ricerca '{q}': {task.exception()}")
+            results.append([])
+        else:
+            results.append(task.result())
+    return results
+
+
+def _merge_results(queries: list, per_query_results: list) -> list:
+    """Unisce i risultati togliendo gli URL già presenti; ogni risultato ricorda la sua query"""
+    seen = set()
+    merged = []
+    for q, results in zip(queries, per_query_results):
+        for r in results:
+            key = _url_key(r["url"]) if r.get("url") else None
+            if key is not None and key in seen:
+                continue
+            seen.add(key)
+            merged.append(dict(r, query=q))
+    return merged
+
+
+@register_async_function("web_search", WEB_SEARCH_FUNCTION_DESC, ToolType.SYSTEM_CTL)
+async def web_search(conn, query: str = None, num_results: int = 5, lang: str = "it", queries: list = None):
+    all_queries = []
+    for q in [query] + list(queries or []):
+        if isinstance(q, str) and q.strip() and q.strip() not in all_queries:
+            all_queries.append(q.strip())
+    if not all_queries:
         return ActionResponse(Action.REQLLM, "Nessuna query di ricerca fornita", None)
+    if len(all_queries) > 1:
+        return await web_search_many(conn, all_queries[:MAX_QUERIES], num_results, lang)
 
+    query = all_queries[0]
     num_results = min(max(1, num_results), 10)
-    cache_key = f"web_search_{query}_{lang}_{num_results}"
-    cached_result = cache_manager.get(CacheType.WEATHER, cache_key)
-    if cached_result:
-        return ActionResponse(Action.REQLLM, cached_result, None)
-
     logger.bind(tag=TAG).info(f"Ricerca web: '{query}'")
-
-    results = search_duckduckgo(query, num_results, lang)
+    results = await search_cache.get(query, lang, num_results)
 
     if not results:
         return ActionResponse(
@@ -131,9 +141,49 @@ def web_search(conn, query: str, num_results: int = 5, lang: str = "it"):
             None
         )
 
+    # Salva i risultati della sessione per leggi_pagina
+    search_results.put(session_key(conn), "last", results)
+
+    # Legge in anticipo i primi risultati mentre l'utente ascolta la risposta
+    from plugins_func.functions.leggi_pagina import prefetch_pages
+    prefetch_pages(conn, results)
+
     result_text = f"**Risultati per: {query}**\n\n"
     for i, r in enumerate(results, 1):
         result_text += f"{i}. **{r['title']}**\n   {r['snippet']}\n\n"
 
-    cache_manager.set(CacheType.WEATHER, cache_key, result_text)
+    return ActionResponse(Action.REQLLM, result_text, None)
+
+
+async def web_search_many(conn, queries: list, num_results: int, lang: str):
+    """Più ricerche in una chiamata: un'unica risposta compatta, senza risultati ripetuti"""
+    per_query = min(max(MULTI_QUERY_MIN_RESULTS, -(-num_results // len(queries))), 10)
+    logger.bind(tag=TAG).info(f"Ricerca web multipla: {queries}")
+    results = _merge_results(queries, await _search_many(queries, lang, per_query))
+
+    if not results:
+        return ActionResponse(Action.REQLLM, f"Nessun risultato trovato per: {', '.join(queries)}", None)
+
+    # Numerazione unica: "leggi il risultato 4" funziona anche sulla ricerca multipla
+    search_results.put(session_key(conn), "last", results)
+
+    # Prima pagina da leggere in anticipo: il primo risultato di ogni ricerca
+    from plugins_func.functions.leggi_pagina import prefetch_pages
+    firsts = {}
+    for r in results:
+        firsts.setdefault(r["query"], r)
+    leaders = list(firsts.values())
+    prefetch_pages(conn, leaders + [r for r in results if r not in leaders])
+
+    result_text = ""
+    current = None
+    for i, r in enumerate(results, 1):
+        if r["query"] != current:
+            current = r["query"]
+            result_text += f"**Risultati per: {current}**\n\n"
+        result_text += f"{i}. **{r['title']}**\n   {r['snippet']}\n\n"
+    missing = [q for q in queries if q not in firsts]
+    if missing:
+        result_text += f"Nessun risultato per: {', '.join(missing)}\n"
+
     return ActionResponse(Action.REQLLM, result_text, None)
@@ -0,0 +1,22 @@
+"""
+I plugin nel server vengono copiati in plugins_func/functions e si importano tra loro
+come plugins_func.functions.*: qui lo stesso nome punta a plugins_custom. config.logger
+viene dal server, quindi i test si lanciano con xiaozhi-server nel PYTHONPATH:
+
+    PYTHONPATH=server/main/xiaozhi-server python -m pytest tests
+"""
+
+import os
+import sys
+import types
+
+PLUGINS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "plugins_custom"))
+
+package = sys.modules.setdefault("plugins_func", types.ModuleType("plugins_func"))
+if not hasattr(package, "__path__"):
+    package.__path__ = []
+if "plugins_func.functions" not in sys.modules:
+    functions = types.ModuleType("plugins_func.functions")
+    functions.__path__ = [PLUGINS_DIR]
+    sys.modules["plugins_func.functions"] = functions
+    package.functions = functions
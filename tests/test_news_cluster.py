@@ -0,0 +1,27 @@
+"""Raggruppamento delle notizie di news_cluster"""
+
+from plugins_func.functions import news_cluster
+
+HEADLINES = [
+    "Terremoto in Calabria, scossa di magnitudo 4.2 avvertita a Cosenza. Nessun danno a persone",
+    "Scossa di terremoto magnitudo 4.2 in Calabria: paura a Cosenza, nessun ferito",
+    "Governo, Meloni incontra i sindacati a Palazzo Chigi sulla manovra",
+    "Manovra, incontro a Palazzo Chigi tra la premier Meloni e i sindacati",
+    "Incidente sulla A1 vicino a Firenze, traffico bloccato per ore",
+]
+
+
+def test_cluster_groups_same_story():
+    assert news_cluster.cluster(HEADLINES) == [[0, 1], [2, 3], [4]]
+
+
+def test_cluster_does_not_chain(monkeypatch):
+    # a~b e b~c, ma a e c non hanno nulla in comune: c non entra nel gruppo di a
+    half = news_cluster.NUM_HASHES // 2
+    signatures = {
+        "a": tuple(range(2 * half)),
+        "b": tuple(list(range(half)) + [1000 + i for i in range(half)]),
+        "c": tuple([2000 + i for i in range(half)] + [1000 + i for i in range(half)]),
+    }
+    monkeypatch.setattr(news_cluster, "minhash", signatures.__getitem__)
+    assert news_cluster.cluster(["a", "b", "c"], threshold=0.4) == [[0, 1], [2]]
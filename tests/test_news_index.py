@@ -0,0 +1,30 @@
+"""Finestra mobile di news_index"""
+
+import time
+
+from plugins_func.functions.news_index import HeadlineIndex
+
+
+def _item(title: str, published=None) -> dict:
+    return {"title": title, "description": "Notizia di cronaca", "link": f"https://example.it/{title}", "published": published}
+
+
+def test_expires_by_publication_time(monkeypatch):
+    now = time.time()
+    index = HeadlineIndex(window=3600)
+    # Pubblicata 50 minuti fa ma letta ora: deve uscire tra 10 minuti, non tra un'ora
+    index.add([_item("terremoto", now - 3000), _item("alluvione")], "ansa", "cronaca")
+    assert index.stats()["documents"] == 2
+
+    monkeypatch.setattr(time, "time", lambda: now + 1200)
+    assert index.search("terremoto") == []
+    assert [doc["title"] for doc in index.search("alluvione")] == ["alluvione"]
+    assert index.stats()["documents"] == 1
+
+
+def test_max_documents_drops_oldest_published():
+    now = time.time()
+    index = HeadlineIndex(window=3600, max_documents=2)
+    index.add([_item("recente", now - 10), _item("vecchia", now - 2000), _item("media", now - 500)], "ansa", "cronaca")
+    assert index.search("vecchia") == []
+    assert index.stats()["documents"] == 2
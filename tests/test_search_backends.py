@@ -0,0 +1,91 @@
+"""Parser dei motori di search_backends su pagine di risultati salvate in fixtures/search"""
+
+import os
+import json
+import asyncio
+import threading
+
+import pytest
+
+from plugins_func.functions.search_backends import (
+    DuckDuckGoHtml, DuckDuckGoLite, SearchBackend, SearxNG,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "search")
+
+
+class FakeResponse:
+    """Quanto dei parser usa della risposta httpx"""
+
+    def __init__(self, name: str):
+        with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+            self.text = f.read()
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+
+def test_ddg_html_parse():
+    results = DuckDuckGoHtml().parse(FakeResponse("ddg_html.html"), 10)
+    assert [r["url"] for r in results] == [
+        "https://www.giallozafferano.it/ricette/Spaghetti-alla-Carbonara.html",
+        "https://www.cucchiaio.it/ricetta/carbonara/",
+        "https://it.wikipedia.org/wiki/Carbonara",
+    ]
+    assert results[0]["title"] == "Spaghetti alla Carbonara - Ricetta di GialloZafferano"
+    assert results[1]["snippet"] == "Tutti i segreti per una carbonara cremosa senza panna."
+
+
+def test_ddg_html_parse_limit():
+    assert len(DuckDuckGoHtml().parse(FakeResponse("ddg_html.html"), 2)) == 2
+
+
+def test_ddg_lite_parse_pairs_snippet_per_row():
+    results = DuckDuckGoLite().parse(FakeResponse("ddg_lite.html"), 10)
+    assert [(r["title"], r["url"], r["snippet"]) for r in results] == [
+        (
+            "Meteo Roma - previsioni a 15 giorni",
+            "https://www.ilmeteo.it/meteo/Roma",
+            "Previsioni del tempo per Roma: oggi sole e temperature fino a 24 gradi.",
+        ),
+        # Nessuno snippet: non deve prendere quello del risultato successivo
+        ("Meteo Roma | 3bmeteo", "https://www.3bmeteo.com/meteo/roma", ""),
+        (
+            "Meteo Roma oggi | Meteo.it",
+            "https://www.meteo.it/meteo/roma",
+            "Che tempo fa a Roma: nuvolosità in aumento dalla sera.",
+        ),
+    ]
+
+
+def test_searxng_parse_skips_results_without_url():
+    results = SearxNG("http://127.0.0.1:8888").parse(FakeResponse("searxng.json"), 10)
+    assert [r["url"] for r in results] == ["https://www.ansa.it/lazio/", "https://roma.repubblica.it/"]
+    assert results[0] == {
+        "title": "Notizie Lazio - ANSA",
+        "snippet": "Le ultime notizie da Roma e dal Lazio.",
+        "url": "https://www.ansa.it/lazio/",
+    }
+
+
+def test_backend_requires_request_and_parse():
+    with pytest.raises(TypeError):
+        SearchBackend("http://example.invalid")
+
+
+def test_search_parses_off_the_loop():
+    class Fixture(DuckDuckGoLite):
+        async def request(self, query, lang):
+            return FakeResponse("ddg_lite.html")
+
+        def parse(self, response, num_results):
+            self.thread = threading.current_thread()
+            return super().parse(response, num_results)
+
+    backend = Fixture()
+    results = asyncio.run(backend.search("meteo roma", 2, "it"))
+    assert len(results) == 2
+    assert backend.thread is not threading.main_thread()